@@ -1,23 +1,34 @@
 import argparse
 import asyncio
 import json
-from os import listdir
+import time
 from pathlib import Path
-from typing import Any, List, Optional, cast
+from typing import Any, Optional
 
-from llama_index.llms.openai import OpenAI
 
-from arc_finetuning_st.cli.evaluation import batch_runner
+from arc_finetuning_st.cli.evaluation import (
+    RunConfig,
+    ShardFailedError,
+    TaskResult,
+    append_result,
+    batch_runner,
+    build_workflow,
+    check_run_config,
+    load_results,
+    merge_shard_results,
+    print_cache_stats,
+    print_summary,
+    run_sharded,
+    select_tasks,
+)
 from arc_finetuning_st.cli.finetune import (
     FINETUNE_JOBS_FILENAME,
     check_job_status,
     prepare_finetuning_jsonl_file,
     submit_finetune_job,
 )
-from arc_finetuning_st.workflows.arc_task_solver import (
-    ARCTaskSolverWorkflow,
-    WorkflowOutput,
-)
+from arc_finetuning_st.llms.rate_limit import RateLimiter
+from arc_finetuning_st.workflows.arc_task_solver import WorkflowOutput
 
 SINGLE_EXAMPLE_JSON_PATH = Path(
     Path(__file__).parents[2].absolute(), "finetuning_examples"
@@ -25,37 +36,154 @@ SINGLE_EXAMPLE_JSON_PATH = Path(
 FINETUNING_ASSETS_PATH = Path(
     Path(__file__).parents[2].absolute(), "finetuning_assets"
 )
+EVALUATION_DATA_PATH = Path(
+    Path(__file__).parents[2].absolute(), "data", "evaluation"
+)
+TASK_RESULTS_PATH = Path(Path(__file__).parents[2].absolute(), "task_results")
 
 
 def handle_evaluate(
     llm: str,
-    batch_size: int,
     num_workers: int,
     verbose: bool,
-    sleep: int,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    max_retries: int = 5,
+    num_candidates: int = 1,
+    max_attempts: int = 3,
+    results_path: Optional[Path] = None,
+    start: int = 0,
+    stop: Optional[int] = 10,
+    all_tasks: bool = False,
+    sample: Optional[int] = None,
+    seed: int = 0,
+    processes: int = 1,
+    cache: bool = True,
+    cache_path: Optional[Path] = None,
+    pool_size: Optional[int] = None,
+    mock_latency: float = 1.0,
+    mock_latency_sigma: float = 0.5,
+    mock_error_rate: float = 0.0,
+    mock_rate_limit_rate: float = 0.0,
+    mock_seed: int = 0,
     **kwargs: Any,
 ) -> None:
-    data_path = Path(
-        Path(__file__).parents[2].absolute(), "data", "evaluation"
-    )
-    task_paths = [data_path / t for t in listdir(data_path)]
-    llm = OpenAI(llm)
-    w = ARCTaskSolverWorkflow(llm=llm, timeout=None)
-    results = asyncio.run(
-        batch_runner(
-            w,
-            task_paths[:10],
-            verbose=verbose,
-            batch_size=batch_size,
-            num_workers=num_workers,
-            sleep=sleep,
-        )
+    task_paths = select_tasks(
+        EVALUATION_DATA_PATH,
+        start=start,
+        stop=None if all_tasks else stop,
+        sample=sample,
+        seed=seed,
     )
-    results = cast(List[WorkflowOutput], results)
-    num_solved = sum(el.passing for el in results)
+    results_path = results_path or Path(
+        TASK_RESULTS_PATH,
+        f"evaluation-{llm}-attempts{max_attempts}-candidates{num_candidates}.jsonl",
+    )
+    check_run_config(
+        results_path,
+        RunConfig(
+            llm=llm, max_attempts=max_attempts, num_candidates=num_candidates
+        ),
+    )
+    # resume: tasks already recorded are not run again, including those of
+    # shards of an interrupted multi-process run
+    merge_shard_results(results_path)
+    results = load_results(results_path)
+    todo = [p for p in task_paths if p.stem not in results]
     print(
-        f"Solved: {num_solved}\nTotal Tasks:{len(results)}\nAverage Solve Rate: {float(num_solved) / len(results)}"
+        f"Evaluating {len(todo)} of {len(task_paths)} tasks "
+        f"({len(task_paths) - len(todo)} already in {results_path})"
+    )
+    cache_path = cache_path or Path(TASK_RESULTS_PATH, "llm_cache.sqlite")
+    workflow_kwargs = {
+        "max_attempts": max_attempts,
+        "num_candidates": num_candidates,
+        "max_retries": max_retries,
+        # each process opens its own connection to the cache
+        "cache_path": cache_path if cache else None,
+        # one connection per concurrent LLM call of a process
+        "pool_size": pool_size or num_workers * num_candidates,
+        # only used with `--llm mock`
+        "mock_kwargs": {
+            "latency": mock_latency,
+            "latency_sigma": mock_latency_sigma,
+            "error_rate": mock_error_rate,
+            "rate_limit_rate": mock_rate_limit_rate,
+            "seed": mock_seed,
+        },
+    }
+    cache_stats = None
+    shard_error: Optional[ShardFailedError] = None
+
+    def _record(
+        task_path: Path, output: WorkflowOutput, latency: float
+    ) -> None:
+        result = TaskResult.from_output(task_path.stem, output, latency)
+        append_result(results_path, result)
+        results[result.task_id] = result
+        if verbose:
+            selected = [
+                results[p.stem] for p in task_paths if p.stem in results
+            ]
+            num_solved = sum(r.passing for r in selected)
+            print(
+                f"Solve rate so far: {num_solved}/{len(selected)}", flush=True
+            )
+
+    start_time = time.perf_counter()
+    try:
+        if processes > 1:
+            try:
+                cache_stats = run_sharded(
+                    todo,
+                    results_path,
+                    processes,
+                    llm,
+                    workflow_kwargs,
+                    requests_per_minute=requests_per_minute,
+                    tokens_per_minute=tokens_per_minute,
+                    num_workers=num_workers,
+                    verbose=verbose,
+                )
+            except ShardFailedError as e:
+                # summarize what the other shards recorded, then fail
+                shard_error = e
+            results = load_results(results_path)
+        else:
+            w = build_workflow(
+                llm,
+                RateLimiter(requests_per_minute, tokens_per_minute),
+                **workflow_kwargs,
+            )
+            try:
+                asyncio.run(
+                    batch_runner(
+                        w,
+                        todo,
+                        verbose=verbose,
+                        num_workers=num_workers,
+                        on_result=_record,
+                    )
+                )
+            finally:
+                if w.cache:
+                    cache_stats = (w.cache.hits, w.cache.misses)
+    except KeyboardInterrupt:
+        print(
+            f"Interrupted. Rerun the same command to resume from {results_path}."
+        )
+        results = load_results(results_path)
+    print_summary(
+        [results[p.stem] for p in task_paths if p.stem in results],
+        max_attempts=max_attempts,
     )
+    if cache_stats is not None:
+        print_cache_stats(*cache_stats)
+    print(f"Wall-clock time: {time.perf_counter() - start_time:.1f}s")
+    if shard_error:
+        raise SystemExit(
+            f"{shard_error}. Rerun the same command to retry their tasks."
+        )
 
 
 def handle_finetune_job_submit(
@@ -138,14 +266,151 @@ def main() -> None:
         "--llm",
         type=str,
         default="gpt-4o",
-        help="The OpenAI LLM model to use with the Workflow.",
+        help="The OpenAI LLM model to use with the Workflow, "
+        "or `mock` for an offline stand-in (see the --mock-* options).",
+    )
+    evaluate_parser.add_argument(
+        "-w",
+        "--num-workers",
+        type=int,
+        default=3,
+        help="Number of tasks solved concurrently.",
     )
-    evaluate_parser.add_argument("-b", "--batch-size", type=int, default=5)
-    evaluate_parser.add_argument("-w", "--num-workers", type=int, default=3)
     evaluate_parser.add_argument(
         "-v", "--verbose", action=argparse.BooleanOptionalAction
     )
-    evaluate_parser.add_argument("-s", "--sleep", type=int, default=10)
+    evaluate_parser.add_argument(
+        "--rpm",
+        dest="requests_per_minute",
+        type=int,
+        default=None,
+        help="Requests per minute allowed to the LLM API (default: unlimited).",
+    )
+    evaluate_parser.add_argument(
+        "--tpm",
+        dest="tokens_per_minute",
+        type=int,
+        default=None,
+        help="Tokens per minute allowed to the LLM API (default: unlimited).",
+    )
+    evaluate_parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=5,
+        help="Retries with exponential backoff of an LLM call that is rate limited (429), fails with a transient 5xx error or times out.",
+    )
+    evaluate_parser.add_argument(
+        "-k",
+        "--num-candidates",
+        type=int,
+        default=1,
+        help="Number of candidate predictions made concurrently per attempt (best-of-N).",
+    )
+    evaluate_parser.add_argument(
+        "-a",
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="Maximum number of prediction, critique and correction rounds per task.",
+    )
+    evaluate_parser.add_argument(
+        "-r",
+        "--results",
+        dest="results_path",
+        type=Path,
+        default=None,
+        help="JSONL file the result of each task is appended to; tasks already in it are skipped "
+        "(default: task_results/evaluation-<llm>-attempts<max-attempts>-candidates<num-candidates>.jsonl). "
+        "It must hold results of the same --llm, --max-attempts and --num-candidates.",
+    )
+    evaluate_parser.add_argument(
+        "--all",
+        dest="all_tasks",
+        action=argparse.BooleanOptionalAction,
+        help="Evaluate the full data/evaluation set.",
+    )
+    # a sample is drawn from the whole set, so it can't start at an index
+    selection_group = evaluate_parser.add_mutually_exclusive_group()
+    selection_group.add_argument(
+        "--start",
+        type=int,
+        default=0,
+        help="Index of the first task of the (sorted) evaluation set.",
+    )
+    evaluate_parser.add_argument(
+        "--stop",
+        type=int,
+        default=10,
+        help="Index after the last task of the (sorted) evaluation set.",
+    )
+    selection_group.add_argument(
+        "--sample",
+        type=int,
+        default=None,
+        help="Evaluate a random sample of this many tasks instead of a slice.",
+    )
+    evaluate_parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the random sample."
+    )
+    evaluate_parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=1,
+        help="Shard the tasks across this many processes, each with its own event loop "
+        "and --num-workers workers. Rate limits are shared by all processes.",
+    )
+    evaluate_parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Reuse LLM outputs of identical calls from earlier runs; "
+        "--no-cache always calls the LLM.",
+    )
+    evaluate_parser.add_argument(
+        "--cache-path",
+        type=Path,
+        default=None,
+        help="SQLite file of the LLM cache (default: task_results/llm_cache.sqlite).",
+    )
+    evaluate_parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=None,
+        help="Keep-alive HTTP connections to the LLM API per process "
+        "(default: --num-workers x --num-candidates).",
+    )
+    evaluate_parser.add_argument(
+        "--mock-latency",
+        type=float,
+        default=1.0,
+        help="Median seconds of a mock LLM call.",
+    )
+    evaluate_parser.add_argument(
+        "--mock-latency-sigma",
+        type=float,
+        default=0.5,
+        help="Sigma of the log-normal mock latency distribution (0 for fixed latency).",
+    )
+    evaluate_parser.add_argument(
+        "--mock-error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of mock LLM calls failing with a server error.",
+    )
+    evaluate_parser.add_argument(
+        "--mock-429-rate",
+        dest="mock_rate_limit_rate",
+        type=float,
+        default=0.0,
+        help="Fraction of mock LLM calls failing with a 429 rate limit error.",
+    )
+    evaluate_parser.add_argument(
+        "--mock-seed",
+        type=int,
+        default=0,
+        help="Seed of the mock LLM outputs, latencies and errors.",
+    )
     evaluate_parser.set_defaults(
         func=lambda args: handle_evaluate(**vars(args))
     )
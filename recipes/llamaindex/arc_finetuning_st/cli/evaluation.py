@@ -1,11 +1,17 @@
 import asyncio
+import multiprocessing
+import os
+import random
+import time
 from os import listdir
 from pathlib import Path
-from typing import Any, List, cast
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from llama_index.core.async_utils import chunks
-from llama_index.llms.openai import OpenAI
+from llama_index.core.bridge.pydantic import BaseModel, Field
 
+from arc_finetuning_st.llms.cache import LLMCache
+from arc_finetuning_st.llms.rate_limit import RateLimiter
+from arc_finetuning_st.llms.registry import DEFAULT_POOL_SIZE, LLMRegistry
 from arc_finetuning_st.workflows.arc_task_solver import (
     ARCTaskSolverWorkflow,
     WorkflowOutput,
@@ -14,44 +20,428 @@ from arc_finetuning_st.workflows.arc_task_solver import (
 DATA_PATH = Path(Path(__file__).parents[1].absolute(), "data", "evaluation")
 
 
+class TaskResult(BaseModel):
+    """Checkpoint record of one evaluated task, one JSON line per task."""
+
+    task_id: str
+    passing: bool
+    attempts: int = Field(description="Number of predictions made.")
+    rounds: int
+    latency: float = Field(description="Wall-clock seconds of the run.")
+    prompt_tokens: int
+    completion_tokens: int
+    best_accuracy: float = Field(
+        default=0.0,
+        description="Highest fraction of correct cells over the predictions.",
+    )
+    solved_round: Optional[int] = Field(
+        default=None, description="Round of the first passing prediction."
+    )
+    round_seconds: List[float] = Field(
+        default_factory=list,
+        description="Seconds per round; candidates of a round run concurrently, "
+        "so a round takes as long as its slowest attempt.",
+    )
+    round_tokens: List[int] = Field(default_factory=list)
+
+    @classmethod
+    def from_output(
+        cls, task_id: str, output: WorkflowOutput, latency: float
+    ) -> "TaskResult":
+        rounds = sorted({a.round for a in output.attempts})
+        round_seconds = [
+            max(a.latency for a in output.attempts if a.round == r)
+            for r in rounds
+        ]
+        round_tokens = [
+            sum(
+                a.prompt_tokens + a.completion_tokens
+                for a in output.attempts
+                if a.round == r
+            )
+            for r in rounds
+        ]
+        passing_rounds = [a.round for a in output.attempts if a.passing]
+        return cls(
+            task_id=task_id,
+            passing=output.passing,
+            attempts=len(output.attempts),
+            rounds=len(rounds),
+            latency=latency,
+            prompt_tokens=sum(a.prompt_tokens for a in output.attempts),
+            completion_tokens=sum(
+                a.completion_tokens for a in output.attempts
+            ),
+            best_accuracy=max(
+                (a.accuracy for a in output.attempts), default=0.0
+            ),
+            solved_round=min(passing_rounds) if passing_rounds else None,
+            round_seconds=round_seconds,
+            round_tokens=round_tokens,
+        )
+
+
+class RunConfig(BaseModel):
+    """Settings that change the result of a task, the first line of a results file."""
+
+    llm: str
+    max_attempts: int
+    num_candidates: int
+
+
+def check_run_config(results_path: Path, config: RunConfig) -> None:
+    """Start a results file with `config`, or check it matches the file's.
+
+    Resuming with another configuration would mix its results into the
+    summary, so a mismatch raises a ValueError. Files written before run
+    configs were recorded are accepted as they are.
+    """
+    if results_path.exists() and results_path.stat().st_size:
+        with open(results_path) as f:
+            header = f.readline()
+        try:
+            recorded = RunConfig.model_validate_json(header)
+        except ValueError:
+            return
+        if recorded != config:
+            raise ValueError(
+                f"{results_path} holds results of {recorded}, not {config}. "
+                "Pass another --results file to evaluate this configuration."
+            )
+        return
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(results_path, "w") as f:
+        f.write(config.model_dump_json() + "\n")
+
+
+def load_results(results_path: Path) -> Dict[str, TaskResult]:
+    """Records of the tasks already evaluated, by task id."""
+    results: Dict[str, TaskResult] = {}
+    if not results_path.exists():
+        return results
+    with open(results_path) as f:
+        for line in f:
+            try:
+                result = TaskResult.model_validate_json(line)
+            except ValueError:
+                # the RunConfig header, or a last line cut short by a crash
+                # mid-write
+                continue
+            results[result.task_id] = result
+    return results
+
+
+def append_result(results_path: Path, result: TaskResult) -> None:
+    """Append a record and make sure it is on disk before moving on."""
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(results_path, "a") as f:
+        f.write(result.model_dump_json() + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def select_tasks(
+    data_path: Path,
+    start: int = 0,
+    stop: Optional[int] = None,
+    sample: Optional[int] = None,
+    seed: int = 0,
+) -> List[Path]:
+    """Task files to evaluate: a slice of the sorted set, or a seeded random sample of it."""
+    task_paths = sorted(data_path / t for t in listdir(data_path))
+    if sample is not None:
+        return sorted(
+            random.Random(seed).sample(
+                task_paths, min(sample, len(task_paths))
+            )
+        )
+    return task_paths[start:stop]
+
+
 async def batch_runner(
     workflow: ARCTaskSolverWorkflow,
     task_paths: List[Path],
-    batch_size: int = 5,
-    verbose: bool = False,
-    sleep: int = 10,
     num_workers: int = 3,
+    verbose: bool = False,
+    on_result: Optional[Callable[[Path, WorkflowOutput, float], None]] = None,
 ) -> List[Any]:
-    output: List[Any] = []
-    sem = asyncio.Semaphore(num_workers)
-    for task_chunk in chunks(task_paths, batch_size):
-        task_chunk = (
-            workflow.load_and_run_task(task_path=task_path, sem=sem)
-            for task_path in task_chunk
-            if task_path is not None
-        )
-        output_chunk = await asyncio.gather(*task_chunk)
-        output.extend(output_chunk)
-        if verbose:
-            print(
-                f"Completed {len(output)} out of {len(task_paths)} tasks",
-                flush=True,
-            )
-        await asyncio.sleep(sleep)
+    """Run the tasks on a bounded pool of workers fed from a queue.
+
+    A worker picks up the next task as soon as it finishes one, so a slow task
+    only holds up its own worker. Throughput is bounded by the workflow's rate
+    limiter (requests and tokens per minute) instead of fixed pauses.
+
+    `on_result` is called with the task path, output and wall-clock seconds as
+    each task completes. A task that raises is reported and left as None.
+    """
+    queue: asyncio.Queue[Tuple[int, Path]] = asyncio.Queue()
+    for item in enumerate(task_paths):
+        queue.put_nowait(item)
+    output: List[Any] = [None] * len(task_paths)
+    num_completed = 0
+    start = time.perf_counter()
+
+    async def _worker() -> None:
+        nonlocal num_completed
+        while not queue.empty():
+            ix, task_path = queue.get_nowait()
+            task_start = time.perf_counter()
+            try:
+                res = await workflow.load_and_run_task(task_path=task_path)
+            except Exception as e:
+                print(f"Task {task_path.stem} failed: {e!r}", flush=True)
+                continue
+            output[ix] = res
+            num_completed += 1
+            if on_result:
+                on_result(task_path, res, time.perf_counter() - task_start)
+            if verbose:
+                elapsed = time.perf_counter() - start
+                print(
+                    f"Completed {num_completed} out of {len(task_paths)} tasks "
+                    f"({task_path.stem}: {'passing' if res.passing else 'failing'}, "
+                    f"{num_completed / elapsed * 60:.1f} tasks/min)",
+                    flush=True,
+                )
+
+    await asyncio.gather(*(_worker() for _ in range(num_workers)))
     return output
 
 
-async def main() -> None:
-    task_paths = [DATA_PATH / t for t in listdir(DATA_PATH)]
-    w = ARCTaskSolverWorkflow(
-        timeout=None, verbose=False, llm=OpenAI("gpt-4o")
+def build_workflow(
+    llm: str,
+    rate_limiter: Optional[RateLimiter] = None,
+    cache_path: Optional[Path] = None,
+    mock_kwargs: Optional[Dict[str, Any]] = None,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    **workflow_kwargs: Any,
+) -> ARCTaskSolverWorkflow:
+    """Workflow for evaluation, caching LLM outputs at `cache_path` if given.
+
+    The one workflow and its LLM client, with a pool of `pool_size`
+    keep-alive connections, serve all the tasks of a process.
+    """
+    llms = LLMRegistry(pool_size=pool_size, mock_kwargs=mock_kwargs)
+    return ARCTaskSolverWorkflow(
+        llm=llms.get(llm),
+        rate_limiter=rate_limiter,
+        cache=LLMCache(cache_path) if cache_path else None,
+        timeout=None,
+        **workflow_kwargs,
+    )
+
+
+def print_cache_stats(hits: int, misses: int) -> None:
+    total = hits + misses
+    print(
+        f"LLM cache: {hits} hits, {misses} misses "
+        f"(hit rate {hits / max(total, 1):.1%})"
+    )
+
+
+def shard_results_path(results_path: Path, shard_ix: int) -> Path:
+    return results_path.with_name(
+        f"{results_path.stem}.shard{shard_ix}{results_path.suffix}"
+    )
+
+
+def merge_shard_results(results_path: Path) -> int:
+    """Move the records of shard result files into the main results file.
+
+    Also picks up shard files left behind by an interrupted run. Returns the
+    number of records merged.
+    """
+    merged = load_results(results_path)
+    num_merged = 0
+    pattern = f"{results_path.stem}.shard*{results_path.suffix}"
+    for shard_path in sorted(results_path.parent.glob(pattern)):
+        for task_id, result in load_results(shard_path).items():
+            if task_id not in merged:
+                append_result(results_path, result)
+                merged[task_id] = result
+                num_merged += 1
+        shard_path.unlink()
+    return num_merged
+
+
+def evaluate_shard(
+    shard_ix: int,
+    task_paths: List[Path],
+    results_path: Path,
+    llm: str,
+    workflow_kwargs: Dict[str, Any],
+    rate_limiter: Optional[RateLimiter],
+    num_workers: int,
+    verbose: bool,
+    cache_stats: Any,
+) -> None:
+    """Worker process entry point: evaluate a shard on its own event loop.
+
+    Cache hits and misses of the shard are put on the `cache_stats` queue.
+    """
+    workflow = build_workflow(llm, rate_limiter, **workflow_kwargs)
+    shard_path = shard_results_path(results_path, shard_ix)
+
+    def _record(
+        task_path: Path, output: WorkflowOutput, latency: float
+    ) -> None:
+        append_result(
+            shard_path, TaskResult.from_output(task_path.stem, output, latency)
+        )
+
+    try:
+        asyncio.run(
+            batch_runner(
+                workflow,
+                task_paths,
+                num_workers=num_workers,
+                verbose=verbose,
+                on_result=_record,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if workflow.cache:
+            cache_stats.put((workflow.cache.hits, workflow.cache.misses))
+
+
+class ShardFailedError(RuntimeError):
+    """Worker processes of a sharded evaluation exited with an error."""
+
+    def __init__(self, failed: List[Tuple[int, Optional[int]]]) -> None:
+        self.failed = failed
+        super().__init__(
+            "Shards failed: "
+            + ", ".join(
+                f"shard {shard_ix} (exit code {exitcode})"
+                for shard_ix, exitcode in failed
+            )
+        )
+
+
+def run_sharded(
+    task_paths: List[Path],
+    results_path: Path,
+    processes: int,
+    llm: str,
+    workflow_kwargs: Dict[str, Any],
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+    num_workers: int = 3,
+    verbose: bool = False,
+) -> Optional[Tuple[int, int]]:
+    """Evaluate the tasks in `processes` worker processes, then merge their results.
+
+    Each process runs its own event loop and pool of `num_workers` workers.
+    The rate limits are kept in shared memory and hold across all processes.
+    Returns the LLM cache hits and misses summed over the processes, or None
+    when the workflows have no cache. Raises
+    ShardFailedError, after merging the results of the other shards, if a
+    worker process exits with an error.
+    """
+    mp_context = multiprocessing.get_context("spawn")
+    rate_limiter = RateLimiter(
+        requests_per_minute, tokens_per_minute, mp_context=mp_context
     )
-    results = await batch_runner(w, task_paths[:10], verbose=True)
-    results = cast(List[WorkflowOutput], results)
+    cache_stats = mp_context.SimpleQueue()
+    workers = [
+        mp_context.Process(
+            target=evaluate_shard,
+            args=(
+                shard_ix,
+                task_paths[shard_ix::processes],
+                results_path,
+                llm,
+                workflow_kwargs,
+                rate_limiter,
+                num_workers,
+                verbose,
+                cache_stats,
+            ),
+        )
+        for shard_ix in range(min(processes, len(task_paths)))
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        # workers also receive Ctrl-C; wait for them before merging
+        for worker in workers:
+            worker.join()
+        merge_shard_results(results_path)
+    totals: Optional[Tuple[int, int]] = None
+    while not cache_stats.empty():
+        shard_hits, shard_misses = cache_stats.get()
+        hits, misses = totals or (0, 0)
+        totals = (hits + shard_hits, misses + shard_misses)
+    failed = [
+        (shard_ix, worker.exitcode)
+        for shard_ix, worker in enumerate(workers)
+        if worker.exitcode != 0
+    ]
+    if failed:
+        raise ShardFailedError(failed)
+    return totals
+
+
+def solve_rate_by_budget(
+    results: List[TaskResult], max_attempts: int
+) -> List[Dict[str, float]]:
+    """Solve rate, mean wall-clock and mean tokens per task for each attempt budget."""
+    rows = []
+    num_results = max(len(results), 1)
+    for budget in range(1, max_attempts + 1):
+        solved = sum(
+            r.solved_round is not None and r.solved_round <= budget
+            for r in results
+        )
+        rows.append(
+            {
+                "attempts": budget,
+                "solved": solved,
+                "solve_rate": solved / num_results,
+                "mean_seconds": sum(
+                    sum(r.round_seconds[:budget]) for r in results
+                )
+                / num_results,
+                "mean_tokens": sum(
+                    sum(r.round_tokens[:budget]) for r in results
+                )
+                / num_results,
+            }
+        )
+    return rows
+
+
+def print_summary(results: List[TaskResult], max_attempts: int) -> None:
     num_solved = sum(el.passing for el in results)
     print(
-        f"Solved: {num_solved}\nTotal Tasks:{len(results)}\nAverage Solve Rate: {float(num_solved) / len(results)}"
+        f"Solved: {num_solved}\nTotal Tasks:{len(results)}\nAverage Solve Rate: {float(num_solved) / max(len(results), 1)}"
+    )
+    print("attempts\tsolved\tsolve rate\tmean seconds\tmean tokens")
+    for row in solve_rate_by_budget(results, max_attempts):
+        print(
+            f"{row['attempts']}\t\t{row['solved']}\t{row['solve_rate']:.3f}"
+            f"\t\t{row['mean_seconds']:.1f}\t\t{row['mean_tokens']:.0f}"
+        )
+
+
+async def main() -> None:
+    task_paths = select_tasks(DATA_PATH, stop=10)
+    w = build_workflow("gpt-4o")
+    results: List[TaskResult] = []
+    await batch_runner(
+        w,
+        task_paths,
+        verbose=True,
+        on_result=lambda path, output, latency: results.append(
+            TaskResult.from_output(path.stem, output, latency)
+        ),
     )
+    print_summary(results, max_attempts=3)
 
 
 if __name__ == "__main__":
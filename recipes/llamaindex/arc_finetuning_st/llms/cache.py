@@ -0,0 +1,91 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from llama_index.core.llms import LLM
+from llama_index.core.prompts import PromptTemplate
+
+
+class LLMCache:
+    """Persistent cache of structured LLM outputs, stored in SQLite.
+
+    Outputs are keyed on the model, the prompt template, the rendered prompt
+    variables, the temperature and the sample index, so replaying the same
+    workflow returns the same outputs without calling the LLM. The database
+    is opened in WAL mode so that evaluation processes can share it.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, output TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(
+        llm: LLM,
+        output_cls: Any,
+        prompt: PromptTemplate,
+        prompt_vars: Dict[str, Any],
+        sample: int = 0,
+    ) -> str:
+        """Cache key of a structured predict call.
+
+        `sample` tells apart independent samples of the same prompt, e.g.
+        best-of-N candidates, which would otherwise all replay one output.
+        """
+        payload = {
+            "model": getattr(llm.metadata, "model_name", type(llm).__name__),
+            "temperature": getattr(llm, "temperature", None),
+            "output_cls": output_cls.__name__,
+            "template": hashlib.sha256(
+                prompt.get_template().encode()
+            ).hexdigest(),
+            "prompt_vars": prompt_vars,
+            "sample": sample,
+        }
+        return hashlib.sha256(
+            json.dumps(payload, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """The cached output JSON, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, output: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                (key, output, time.time()),
+            )
+            self._conn.commit()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple, Union
+
+from llama_index.core.bridge.pydantic import (
+    BaseModel,
+    Field,
+    PrivateAttr,
+)
+from llama_index.core.llms import (
+    CompletionResponse,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.utils import get_tokenizer
+
+from arc_finetuning_st.workflows.models import Critique, Prediction
+
+MOCK_LLM_NAME = "mock"
+
+WORDS = (
+    "the grid pattern repeats each row column colour shape object moves "
+    "fills mirrors rotates copies border corner diagonal background cell"
+).split()
+
+
+class MockLLMError(Exception):
+    """Simulated server error of the mock LLM."""
+
+    status_code = 500
+
+
+class MockRateLimitError(MockLLMError):
+    """Simulated HTTP 429, retried by the workflow like the API's."""
+
+    status_code = 429
+
+
+class MockLLM(CustomLLM):
+    """Offline stand-in for the OpenAI LLM, to benchmark the workflow without API calls.
+
+    Structured predictions return schema-valid `Prediction` and `Critique`
+    outputs after a simulated latency, and fail at the configured rates with
+    a 429 or a server error. Predictions are the test input with a few cells
+    recoloured, so tasks generally run all their rounds.
+
+    Outputs, latencies and errors are drawn from an RNG seeded with the
+    prompt and the number of times it was asked, so a run is reproducible
+    whatever the order concurrent calls are made in.
+    """
+
+    model_name: str = Field(default=MOCK_LLM_NAME)
+    temperature: float = Field(default=0.0)
+    latency: float = Field(
+        default=1.0, description="Median seconds of a call, before tokens."
+    )
+    latency_sigma: float = Field(
+        default=0.5,
+        description="Sigma of the log-normal latency; 0 for a fixed latency.",
+    )
+    seconds_per_token: float = Field(
+        default=0.0, description="Added latency per completion token."
+    )
+    rationale_words: int = Field(
+        default=100, description="Length of generated rationales/critiques."
+    )
+    error_rate: float = Field(default=0.0, ge=0.0, le=1.0)
+    rate_limit_rate: float = Field(default=0.0, ge=0.0, le=1.0)
+    seed: int = Field(default=0)
+
+    # shared by copies of the LLM, e.g. the candidates' higher temperature
+    _usage: Counter = PrivateAttr(default_factory=Counter)
+    _asked: Counter = PrivateAttr(default_factory=Counter)
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=self.model_name)
+
+    @property
+    def usage(self) -> Dict[str, int]:
+        """Calls, errors and token counts of all calls so far."""
+        return dict(self._usage)
+
+    def _rng(
+        self, output_cls: Any, prompt_args: Dict[str, Any]
+    ) -> random.Random:
+        key = json.dumps(
+            [output_cls.__name__, self.temperature, prompt_args],
+            sort_keys=True,
+            default=str,
+        )
+        self._asked[key] += 1
+        digest = hashlib.sha256(
+            f"{self.seed}:{self._asked[key]}:{key}".encode()
+        ).digest()
+        return random.Random(digest)
+
+    def _text(self, rng: random.Random) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(self.rationale_words))
+
+    def _prediction_grid(self, rng: random.Random, test_input: str) -> str:
+        rows: List[List[str]] = [
+            row.split(",") for row in test_input.splitlines()
+        ] or [["0"]]
+        for _ in range(rng.randint(1, 3)):
+            row = rng.choice(rows)
+            row[rng.randrange(len(row))] = str(rng.randint(0, 9))
+        return "\n".join(",".join(row) for row in rows)
+
+    def _generate(
+        self, output_cls: Any, prompt: PromptTemplate, **prompt_args: Any
+    ) -> Tuple[Union[BaseModel, Exception], float]:
+        """The structured output, or a simulated error, and the seconds it takes."""
+        rng = self._rng(output_cls, prompt_args)
+        tokenizer = get_tokenizer()
+        self._usage["calls"] += 1
+        self._usage["prompt_tokens"] += len(
+            tokenizer(prompt.format(**prompt_args))
+        )
+        latency = self.latency * rng.lognormvariate(0, self.latency_sigma)
+
+        draw = rng.random()
+        if draw < self.rate_limit_rate:
+            self._usage["rate_limited"] += 1
+            return MockRateLimitError("Rate limit reached (mock)."), latency
+        if draw < self.rate_limit_rate + self.error_rate:
+            self._usage["errors"] += 1
+            return MockLLMError("Server error (mock)."), latency
+
+        if output_cls is Critique:
+            output_json = json.dumps({"critique": self._text(rng)})
+        elif output_cls is Prediction:
+            output_json = json.dumps(
+                {
+                    "rationale": self._text(rng),
+                    "prediction": self._prediction_grid(
+                        rng, prompt_args.get("test_input", "")
+                    ),
+                }
+            )
+        else:
+            raise ValueError(f"MockLLM cannot generate {output_cls.__name__}.")
+        completion_tokens = len(tokenizer(output_json))
+        self._usage["completion_tokens"] += completion_tokens
+        latency += completion_tokens * self.seconds_per_token
+        return output_cls.model_validate_json(output_json), latency
+
+    def structured_predict(
+        self, output_cls: Any, prompt: PromptTemplate, **prompt_args: Any
+    ) -> BaseModel:
+        output, latency = self._generate(output_cls, prompt, **prompt_args)
+        time.sleep(latency)
+        if isinstance(output, Exception):
+            raise output
+        return output
+
+    async def astructured_predict(
+        self, output_cls: Any, prompt: PromptTemplate, **prompt_args: Any
+    ) -> BaseModel:
+        output, latency = self._generate(output_cls, prompt, **prompt_args)
+        await asyncio.sleep(latency)
+        if isinstance(output, Exception):
+            raise output
+        return output
+
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        rng = random.Random(f"{self.seed}:{prompt}")
+        return CompletionResponse(text=self._text(rng))
+
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        text = ""
+        for word in self.complete(prompt).text.split():
+            text += word + " "
+            yield CompletionResponse(text=text, delta=word + " ")
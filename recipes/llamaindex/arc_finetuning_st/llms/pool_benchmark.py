@@ -0,0 +1,143 @@
+"""Micro-benchmark: per-request overhead of LLM calls with and without pooling.
+
+Calls a local stand-in of the chat completions API, which answers at once,
+so the timings are the client-side overhead of a call. `fresh` builds a new
+OpenAI LLM per request that closes its connection afterwards, as the app
+did per click. `pooled` gets the LLM from an `LLMRegistry`, reusing its
+keep-alive connections. The stand-in is plain HTTP, so against the API each
+new connection additionally costs a TLS handshake and more round trips.
+
+    python -m arc_finetuning_st.llms.pool_benchmark --requests 200 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from llama_index.core.llms import LLM, ChatMessage
+from llama_index.llms.openai import OpenAI
+
+from arc_finetuning_st.llms.registry import LLMRegistry
+
+MODEL = "gpt-4o"
+COMPLETION = json.dumps(
+    {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": 0,
+        "model": MODEL,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "ok"},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": 1,
+            "completion_tokens": 1,
+            "total_tokens": 2,
+        },
+    }
+).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every POST with the same chat completion, keeping connections open."""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, don't wait for delayed ACKs
+    disable_nagle_algorithm = True
+    connections = 0
+    _lock = threading.Lock()
+
+    def setup(self) -> None:
+        super().setup()
+        with self._lock:
+            StandInHandler.connections += 1
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+async def bench(
+    get_llm: Callable[[], LLM], num_requests: int, concurrency: int
+) -> Dict[str, Any]:
+    """Make `num_requests` chat calls, `concurrency` at a time."""
+    messages = [ChatMessage(role="user", content="ping")]
+    latencies: List[float] = []
+    sem = asyncio.Semaphore(concurrency)
+    connections = StandInHandler.connections
+
+    async def _call() -> None:
+        async with sem:
+            start = time.perf_counter()
+            await get_llm().achat(messages)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_call() for _ in range(num_requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "mean_ms": round(float(np.mean(latencies)) * 1000, 2),
+        "p50_ms": round(float(np.median(latencies)) * 1000, 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2),
+        "requests_per_s": round(num_requests / elapsed, 1),
+        "connections_opened": StandInHandler.connections - connections,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    registry = LLMRegistry(pool_size=args.concurrency)
+    results: Dict[str, Any] = {}
+    for concurrency in sorted({1, args.concurrency}):
+        # warm up imports and the pool before timing
+        await bench(lambda: registry.get(MODEL), concurrency, concurrency)
+        results[f"concurrency_{concurrency}"] = {
+            "fresh": await bench(
+                lambda: OpenAI(MODEL, reuse_client=False),
+                args.requests,
+                concurrency,
+            ),
+            "pooled": await bench(
+                lambda: registry.get(MODEL), args.requests, concurrency
+            ),
+        }
+    await registry.aclose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # picked up by the OpenAI LLMs built by the benchmark
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "sk-stand-in"
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        server.shutdown()
+    print(json.dumps({"requests": args.requests, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import asyncio
+import multiprocessing
+import random
+import time
+from typing import Any, Awaitable, Callable, Collection, Optional, TypeVar
+
+import httpx
+import openai
+
+T = TypeVar("T")
+
+# rate limits and transient server errors, retried with backoff by default
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+TIMEOUT_ERRORS = (
+    asyncio.TimeoutError,
+    httpx.TimeoutException,
+    openai.APITimeoutError,
+)
+
+
+class TokenBucket:
+    """Async token bucket holding up to `capacity` units, refilled at `capacity` per `period` seconds."""
+
+    def __init__(self, capacity: float, period: float = 60.0) -> None:
+        self.capacity = capacity
+        self.rate = capacity / period
+        self._available = capacity
+        self._updated = time.monotonic()
+
+    def _take(self, amount: float) -> float:
+        """Take `amount` units if available, else return the seconds to wait for them.
+
+        Never awaits, so it runs atomically on the event loop and waiting
+        callers don't hold up the others.
+        """
+        now = time.monotonic()
+        self._available = min(
+            self.capacity, self._available + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        if self._available >= amount:
+            self._available -= amount
+            return 0.0
+        return (amount - self._available) / self.rate
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """Wait until `amount` units are available and take them."""
+        # a request larger than the bucket could never be served otherwise
+        amount = min(amount, self.capacity)
+        while (wait := self._take(amount)) > 0:
+            await asyncio.sleep(wait)
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after the API reported a rate limit."""
+        self._available = 0.0
+        self._updated = time.monotonic()
+
+
+class SharedTokenBucket:
+    """Token bucket kept in shared memory, so worker processes draw from one budget.
+
+    Create it in the parent process with a multiprocessing context and pass it
+    to the worker processes as an argument.
+    """
+
+    def __init__(
+        self, capacity: float, period: float = 60.0, mp_context: Any = None
+    ) -> None:
+        mp_context = mp_context or multiprocessing.get_context()
+        self.capacity = capacity
+        self.rate = capacity / period
+        self._available = mp_context.RawValue("d", capacity)
+        self._updated = mp_context.RawValue("d", time.time())
+        self._lock = mp_context.Lock()
+
+    def _take(self, amount: float) -> float:
+        """Take `amount` units if available, else return the seconds to wait for them."""
+        with self._lock:
+            now = time.time()
+            available = min(
+                self.capacity,
+                self._available.value
+                + (now - self._updated.value) * self.rate,
+            )
+            self._updated.value = now
+            if available >= amount:
+                self._available.value = available - amount
+                return 0.0
+            self._available.value = available
+            return (amount - available) / self.rate
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """Wait until `amount` units are available and take them."""
+        amount = min(amount, self.capacity)
+        while (wait := self._take(amount)) > 0:
+            await asyncio.sleep(wait)
+
+    def drain(self) -> None:
+        with self._lock:
+            self._available.value = 0.0
+            self._updated.value = time.time()
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits shared by all LLM calls.
+
+    With an `mp_context` the limits are kept in shared memory and hold across
+    all the processes the limiter is passed to.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        mp_context: Any = None,
+    ) -> None:
+        def _bucket(capacity: Optional[int]) -> Any:
+            if not capacity:
+                return None
+            if mp_context is not None:
+                return SharedTokenBucket(capacity, mp_context=mp_context)
+            return TokenBucket(capacity)
+
+        self._requests = _bucket(requests_per_minute)
+        self._tokens = _bucket(tokens_per_minute)
+
+    async def acquire(self, num_tokens: int) -> None:
+        if self._requests:
+            await self._requests.acquire(1)
+        if self._tokens:
+            await self._tokens.acquire(num_tokens)
+
+    def backoff(self) -> None:
+        """Stop handing out capacity until the buckets refill."""
+        for bucket in (self._requests, self._tokens):
+            if bucket:
+                bucket.drain()
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(
+            getattr(error, "response", None), "status_code", None
+        )
+    return status_code
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether an LLM client error is an HTTP 429."""
+    return _status_code(error) == 429
+
+
+def is_retryable_error(
+    error: BaseException,
+    retry_status_codes: Collection[int] = RETRYABLE_STATUS_CODES,
+) -> bool:
+    """Whether an LLM client error is a timeout or has one of `retry_status_codes`."""
+    return (
+        isinstance(error, TIMEOUT_ERRORS)
+        or _status_code(error) in retry_status_codes
+    )
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def retry_on_transient_error(
+    fn: Callable[[], Awaitable[T]],
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    limiter: Optional[RateLimiter] = None,
+    retry_status_codes: Collection[int] = RETRYABLE_STATUS_CODES,
+) -> T:
+    """Await `fn()`, retrying timeouts and `retry_status_codes` with exponential backoff and jitter.
+
+    By default these are 429s and transient 5xx server errors. A `retry-after`
+    header, when present, takes precedence over the computed delay. Only 429s
+    drain the `limiter`. Other errors are raised immediately.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if (
+                not is_retryable_error(e, retry_status_codes)
+                or attempt == max_retries
+            ):
+                raise
+            if limiter and is_rate_limit_error(e):
+                limiter.backoff()
+            delay = _retry_after(e) or min(max_delay, base_delay * 2**attempt)
+            await asyncio.sleep(delay * random.uniform(1.0, 1.5))
+    raise AssertionError("unreachable")
@@ -0,0 +1,76 @@
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+from llama_index.core.llms import LLM
+from llama_index.llms.openai import OpenAI
+
+from arc_finetuning_st.llms.mock import MOCK_LLM_NAME, MockLLM
+
+# connections kept open to the API, shared by all models of a registry
+DEFAULT_POOL_SIZE = 20
+# seconds an idle connection is kept alive for reuse
+KEEPALIVE_EXPIRY = 30.0
+
+
+def build_llm(
+    llm: str,
+    mock_kwargs: Optional[Dict[str, Any]] = None,
+    http_client: Optional[httpx.Client] = None,
+    async_http_client: Optional[httpx.AsyncClient] = None,
+) -> LLM:
+    """OpenAI LLM by model name, or the offline MockLLM for `mock`.
+
+    Without HTTP clients, the OpenAI LLM opens its own connections.
+    """
+    if llm == MOCK_LLM_NAME:
+        return MockLLM(**(mock_kwargs or {}))
+    return OpenAI(
+        llm, http_client=http_client, async_http_client=async_http_client
+    )
+
+
+class LLMRegistry:
+    """LLM clients by model name, created once and shared by all users.
+
+    All models share one pool of at most `pool_size` keep-alive connections,
+    so calls reuse open connections instead of setting up TCP and TLS each
+    time. Calls beyond `pool_size` wait for a free connection, so it should
+    be at least the number of concurrent LLM calls.
+
+    Thread-safe, so Streamlit sessions can share one registry. Async calls
+    must all be made from one event loop, which owns the pooled connections.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        mock_kwargs: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.pool_size = pool_size
+        self._mock_kwargs = mock_kwargs
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        self._http_client = httpx.Client(limits=limits)
+        self._async_http_client = httpx.AsyncClient(limits=limits)
+        self._llms: Dict[str, LLM] = {}
+        self._lock = threading.Lock()
+
+    def get(self, llm: str) -> LLM:
+        with self._lock:
+            if llm not in self._llms:
+                self._llms[llm] = build_llm(
+                    llm,
+                    self._mock_kwargs,
+                    http_client=self._http_client,
+                    async_http_client=self._async_http_client,
+                )
+            return self._llms[llm]
+
+    async def aclose(self) -> None:
+        """Close the pooled connections, from the loop the calls were made on."""
+        self._http_client.close()
+        await self._async_http_client.aclose()
@@ -1,21 +1,31 @@
-from typing import Tuple
+import os
 
 import streamlit as st
-from llama_index.core.tools.function_tool import async_to_sync
 
-from arc_finetuning_st.streamlit.controller import Controller
+from arc_finetuning_st.llms.registry import DEFAULT_POOL_SIZE, LLMRegistry
+from arc_finetuning_st.streamlit.catalog import NUM_COLORS
+from arc_finetuning_st.streamlit.controller import DEFAULT_LLM, Controller
+from arc_finetuning_st.streamlit.figures import show_grid, task_grid_figure
+from arc_finetuning_st.streamlit.resources import SharedResources
 
 # startup
 st.set_page_config(layout="wide")
 
 
 @st.cache_resource
-def startup() -> Tuple[Controller,]:
-    controller = Controller()
-    return (controller,)
+def startup() -> SharedResources:
+    # shared by all sessions
+    pool_size = int(os.environ.get("ARC_LLM_POOL_SIZE", DEFAULT_POOL_SIZE))
+    return SharedResources(llms=LLMRegistry(pool_size=pool_size))
 
 
-(controller,) = startup()
+resources = startup()
+# per session, so users never see or overwrite each other's runs
+if "controller" not in st.session_state:
+    st.session_state["controller"] = Controller(
+        resources, llm=os.environ.get("ARC_LLM", DEFAULT_LLM)
+    )
+controller: Controller = st.session_state["controller"]
 
 # states
 if "show_finetuning_preview_dialog" not in st.session_state:
@@ -30,6 +40,11 @@ if "disable_preview_button" not in st.session_state:
     st.session_state["disable_preview_button"] = True
 if "metric_value" not in st.session_state:
     st.session_state["metric_value"] = "N/A"
+if "run_error" not in st.session_state:
+    st.session_state["run_error"] = None
+
+# apply a run that finished since the last rerun, before any widget is drawn
+controller.collect_run()
 
 logo = '[<img src="https://d3ddy8balm3goa.cloudfront.net/llamaindex/LlamaLogoSmall.png" width="28" height="28" />](https://github.com/run-llama/llama-agents "Check out the llama-agents Github repo!")'
 st.title("ARC Task Solver with Human Input")
@@ -39,16 +54,61 @@ st.markdown(
 )
 
 # sidebar
+catalog = controller.catalog
+catalog.refresh()
+selected_task = st.session_state.get("selected_task")
+if selected_task is not None and selected_task not in catalog:
+    # the selected task file was removed or can no longer be read
+    controller.reset()
+    del st.session_state["selected_task"]
 with st.sidebar:
+    query = st.text_input("Search tasks", placeholder="task id")
+    with st.expander("Filters"):
+        side_range = st.slider(
+            "Largest grid side", min_value=1, max_value=30, value=(1, 30)
+        )
+        # a slider's bounds must differ
+        max_num_train = max(catalog.max_num_train, 2)
+        train_range = st.slider(
+            "Train examples",
+            min_value=1,
+            max_value=max_num_train,
+            value=(1, max_num_train),
+        )
+        colors = st.multiselect(
+            "Uses colours", options=list(range(NUM_COLORS))
+        )
+        saved_filter = st.radio(
+            "Fine-tuning example",
+            options=["any", "saved", "not saved"],
+            horizontal=True,
+        )
+    task_names = catalog.search(
+        query,
+        side_range=side_range,
+        train_range=train_range,
+        colors=colors,
+        saved={"any": None, "saved": True, "not saved": False}[saved_filter],
+    )
+    # keep the task being solved listed, filters only narrow down the others
+    selected_task = st.session_state.get("selected_task")
+    if selected_task and selected_task not in task_names:
+        task_names = [selected_task] + task_names
+    st.caption(f"{len(task_names)} of {len(catalog.task_ids)} tasks")
     task_selection = st.radio(
         label="Tasks",
-        options=controller.task_file_names,
+        options=task_names,
         index=0,
         on_change=controller.selectbox_selection_change_handler,
         key="selected_task",
         format_func=controller.radio_format_task_name,
     )
 
+selected_task = st.session_state.selected_task
+task = controller.load_task(selected_task) if selected_task else None
+task_path = controller.task_path(selected_task) if selected_task else None
+task_mtime_ns = catalog[selected_task].mtime_ns if selected_task else None
+
 train_col, test_col = st.columns(
     [1, 1], vertical_alignment="top", gap="medium"
 )
@@ -56,9 +116,7 @@ train_col, test_col = st.columns(
 with train_col:
     st.subheader("Train Examples")
     with st.container():
-        selected_task = st.session_state.selected_task
-        if selected_task:
-            task = controller.load_task(selected_task)
+        if task:
             num_examples = len(task["train"])
             tabs = st.tabs(
                 [f"Example {ix}" for ix in range(1, num_examples + 1)]
@@ -69,16 +127,16 @@ with train_col:
                         [1, 1], vertical_alignment="top", gap="medium"
                     )
                     with left:
-                        ex = task["train"][ix]
-                        grid = ex["input"]
-                        fig = Controller.plot_grid(grid, kind="input")
-                        st.plotly_chart(fig, use_container_width=True)
+                        fig = task_grid_figure(
+                            task_path, task_mtime_ns, "train", ix, "input"
+                        )
+                        show_grid(fig, kind="input")
 
                     with right:
-                        ex = task["train"][ix]
-                        grid = ex["output"]
-                        fig = Controller.plot_grid(grid, kind="output")
-                        st.plotly_chart(fig, use_container_width=True)
+                        fig = task_grid_figure(
+                            task_path, task_mtime_ns, "train", ix, "output"
+                        )
+                        show_grid(fig, kind="output")
 
 
 with test_col:
@@ -90,7 +148,7 @@ with test_col:
     with start_col:
         st.button(
             "start",
-            on_click=async_to_sync(controller.handle_prediction_click),
+            on_click=controller.handle_prediction_click,
             use_container_width=True,
             type="primary",
             disabled=st.session_state.get("disable_start_button"),
@@ -98,16 +156,23 @@ with test_col:
     with preview_col:
         st.button(
             "fine-tuning example",
-            on_click=async_to_sync(controller.handle_finetuning_preview_click),
+            on_click=controller.handle_finetuning_preview_click,
             use_container_width=True,
             disabled=st.session_state.get("disable_preview_button"),
             key="preview_button",
         )
 
+    # polls the background run, without rerunning the rest of the app
+    @st.fragment(run_every=0.5 if controller.running else None)
+    def run_progress() -> None:
+        controller.show_run_progress()
+
+    run_progress()
+    if st.session_state.get("run_error"):
+        st.error(f"Workflow run failed: {st.session_state.run_error}")
+
     with st.container():
-        selected_task = st.session_state.selected_task
-        if selected_task:
-            task = controller.load_task(selected_task)
+        if task:
             num_cases = len(task["test"])
             tabs = st.tabs(
                 [f"Test Case {ix}" for ix in range(1, num_cases + 1)]
@@ -118,19 +183,19 @@ with test_col:
                         [1, 1], vertical_alignment="top", gap="medium"
                     )
                     with left:
-                        ex = task["test"][ix]
-                        grid = ex["input"]
-                        fig = Controller.plot_grid(grid, kind="input")
-                        st.plotly_chart(fig, use_container_width=True)
+                        fig = task_grid_figure(
+                            task_path, task_mtime_ns, "test", ix, "input"
+                        )
+                        show_grid(fig, kind="input")
 
                     with right:
                         prediction_fig = st.session_state.get(
                             "prediction", None
                         )
                         if prediction_fig:
-                            st.plotly_chart(
+                            show_grid(
                                 prediction_fig,
-                                use_container_width=True,
+                                kind="latest prediction",
                                 key="prediction",
                             )
 
@@ -177,7 +242,7 @@ with test_col:
             with continue_col:
                 st.button(
                     "continue",
-                    on_click=async_to_sync(controller.handle_prediction_click),
+                    on_click=controller.handle_prediction_click,
                     use_container_width=True,
                     disabled=st.session_state.get("disable_continue_button"),
                     key="continue_button",
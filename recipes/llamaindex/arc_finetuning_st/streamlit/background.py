@@ -0,0 +1,153 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Coroutine, Dict, List, Optional
+
+from llama_index.core.bridge.pydantic import BaseModel, Field
+from llama_index.core.workflow import Context, Workflow
+from llama_index.core.workflow.handler import WorkflowHandler
+
+# llama-index-core 0.11.11 (pinned in poetry.lock) has no public API to stop
+# the step tasks of a run or to release a finished context, so the two helpers
+# below reach into its private state. Check them when upgrading.
+
+
+def cancel_step_tasks(ctx: Context) -> None:
+    """Cancel the step tasks of a run, which outlive its cancelled handler."""
+    for task in ctx._tasks:
+        task.cancel()
+
+
+def release_context(workflow: Workflow, ctx: Context) -> None:
+    """Drop a context from a reused workflow, which keeps every one it started."""
+    workflow._contexts.discard(ctx)
+
+
+class BackgroundLoop:
+    """An asyncio event loop running on a daemon thread.
+
+    Workflows run on this loop while Streamlit script threads only submit
+    work and poll for results, so a rerun never blocks on a run. Contexts
+    stay on the one loop across runs, so they can be continued.
+    """
+
+    def __init__(self, name: str = "workflow-loop") -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name=name, daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> Future:
+        """Schedule a coroutine on the loop, returning a concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, Any], timeout: float = 30) -> Any:
+        """Run a coroutine on the loop and wait for its result."""
+        return self.submit(coro).result(timeout)
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class StepUpdate(BaseModel):
+    """A workflow event streamed by a run, with its timing."""
+
+    event: str = Field(description="Event type name.")
+    candidate_ix: Optional[int] = Field(default=None)
+    elapsed: float = Field(description="Seconds since the run started.")
+    duration: float = Field(
+        description="Seconds taken by the step that emitted this event: since "
+        "the previous event of the same candidate, or of any candidate."
+    )
+
+
+class WorkflowRun:
+    """A workflow run on the background loop, streaming its events to a queue.
+
+    The run's step events are put on `updates` as they happen. `poll()`
+    collects them from the script thread without blocking. Once `done`,
+    `result()` returns the workflow output or raises its error.
+    """
+
+    def __init__(
+        self,
+        loop: BackgroundLoop,
+        workflow: Workflow,
+        ctx: Optional[Context] = None,
+        ctx_updates: Optional[Dict[str, Any]] = None,
+        **run_kwargs: Any,
+    ) -> None:
+        self.updates: "queue.Queue[StepUpdate]" = queue.Queue()
+        self.steps: List[StepUpdate] = []
+        self.handler: Optional[WorkflowHandler] = None
+        self._future = loop.submit(
+            self._run(workflow, ctx, ctx_updates or {}, run_kwargs)
+        )
+
+    async def _run(
+        self,
+        workflow: Workflow,
+        ctx: Optional[Context],
+        ctx_updates: Dict[str, Any],
+        run_kwargs: Dict[str, Any],
+    ) -> Any:
+        if ctx is not None:
+            # drop events left on the stream by a cancelled run
+            while not ctx.streaming_queue.empty():
+                ctx.streaming_queue.get_nowait()
+            for key, value in ctx_updates.items():
+                await ctx.set(key, value)
+
+        handler = workflow.run(ctx=ctx, **run_kwargs)
+        self.handler = handler
+        start = last_any = time.perf_counter()
+        last: Dict[Optional[int], float] = {}
+        try:
+            async for ev in handler.stream_events():
+                now = time.perf_counter()
+                candidate_ix = getattr(ev, "candidate_ix", None)
+                self.updates.put(
+                    StepUpdate(
+                        event=type(ev).__name__,
+                        candidate_ix=candidate_ix,
+                        elapsed=now - start,
+                        duration=now - last.get(candidate_ix, last_any),
+                    )
+                )
+                last_any = now
+                if candidate_ix is not None:
+                    last[candidate_ix] = now
+            return await handler
+        except asyncio.CancelledError:
+            # the workflow's step tasks outlive the handler, stop them too so
+            # that they don't keep calling the LLM
+            if handler.ctx:
+                cancel_step_tasks(handler.ctx)
+            raise
+
+    def poll(self) -> List[StepUpdate]:
+        """All updates so far, collecting the new ones from the queue."""
+        while True:
+            try:
+                self.steps.append(self.updates.get_nowait())
+            except queue.Empty:
+                return self.steps
+
+    @property
+    def done(self) -> bool:
+        return self._future.done()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._future.cancelled()
+
+    def result(self) -> Any:
+        return self._future.result(timeout=0)
+
+    def cancel(self) -> None:
+        self._future.cancel()
@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from llama_index.core.bridge.pydantic import BaseModel, Field
+
+from arc_finetuning_st.workflows.grid import Grid
+
+logger = logging.getLogger(__name__)
+
+NUM_COLORS = 10
+# seconds after which the task files are checked for in-place edits, which
+# leave the directory's mtime unchanged
+RESCAN_INTERVAL = 10.0
+
+
+class TaskInfo(BaseModel):
+    """Metadata of an ARC task file."""
+
+    task_id: str = Field(description="File name of the task.")
+    num_train: int
+    num_test: int
+    shapes: List[Tuple[int, int]] = Field(
+        description="(height, width) of every grid, train then test."
+    )
+    color_counts: List[int] = Field(
+        description="Number of cells of each colour over all grids."
+    )
+    mtime_ns: int
+
+    @property
+    def max_side(self) -> int:
+        return max(max(shape) for shape in self.shapes)
+
+    @property
+    def colors(self) -> Set[int]:
+        return {c for c, count in enumerate(self.color_counts) if count}
+
+    @classmethod
+    def from_file(cls, path: Path, mtime_ns: int) -> "TaskInfo":
+        with open(path) as f:
+            task = json.load(f)
+        grids = [
+            Grid.from_list(pair[kind])
+            for split in ("train", "test")
+            for pair in task[split]
+            for kind in ("input", "output")
+            if kind in pair
+        ]
+        counts = np.zeros(NUM_COLORS, dtype=np.int64)
+        for grid in grids:
+            counts += np.bincount(grid.array.ravel(), minlength=NUM_COLORS)[
+                :NUM_COLORS
+            ]
+        return cls(
+            task_id=path.name,
+            num_train=len(task["train"]),
+            num_test=len(task["test"]),
+            shapes=[grid.shape for grid in grids],
+            color_counts=counts.tolist(),
+            mtime_ns=mtime_ns,
+        )
+
+
+class TaskCatalog:
+    """Index of the task files and saved fine-tuning examples.
+
+    Built once; `refresh` re-scans the task directory when its mtime changed
+    or `rescan_interval` seconds passed since the last scan, and then re-reads
+    only the task files whose own mtime changed. Only `*.json` files are
+    indexed, those that can't be parsed are logged and skipped. Saved examples
+    are listed again only when their directory's mtime changed. Safe to share
+    between sessions.
+    """
+
+    def __init__(
+        self,
+        data_path: Path,
+        finetuning_examples_path: Path,
+        rescan_interval: float = RESCAN_INTERVAL,
+    ) -> None:
+        self._data_path = data_path
+        self._finetuning_examples_path = finetuning_examples_path
+        self._rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, TaskInfo] = {}
+        # mtimes of the files that failed to parse, so each is logged once
+        self._invalid: Dict[str, int] = {}
+        self._data_mtime_ns: Optional[int] = None
+        self._scanned_at: Optional[float] = None
+        self._saved: Set[str] = set()
+        self._saved_mtime_ns: Optional[int] = None
+        self.refresh()
+
+    @staticmethod
+    def _mtime_ns(path: Path) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> None:
+        """Pick up added, removed or modified tasks and saved examples."""
+        with self._lock:
+            data_mtime_ns = self._mtime_ns(self._data_path)
+            now = time.monotonic()
+            if (
+                data_mtime_ns != self._data_mtime_ns
+                or self._scanned_at is None
+                or now - self._scanned_at >= self._rescan_interval
+            ):
+                self._scan_tasks()
+                self._data_mtime_ns = data_mtime_ns
+                self._scanned_at = now
+
+            saved_mtime_ns = self._mtime_ns(self._finetuning_examples_path)
+            if saved_mtime_ns != self._saved_mtime_ns:
+                self._saved = (
+                    set(os.listdir(self._finetuning_examples_path))
+                    if saved_mtime_ns is not None
+                    else set()
+                )
+                self._saved_mtime_ns = saved_mtime_ns
+
+    def _scan_tasks(self) -> None:
+        try:
+            entries = [
+                entry
+                for entry in os.scandir(self._data_path)
+                if entry.name.endswith(".json") and entry.is_file()
+            ]
+        except FileNotFoundError:
+            entries = []
+        tasks = {}
+        invalid = {}
+        for entry in entries:
+            try:
+                mtime_ns = entry.stat().st_mtime_ns
+            except FileNotFoundError:
+                # removed since the directory was listed
+                continue
+            info = self._tasks.get(entry.name)
+            if info is None or info.mtime_ns != mtime_ns:
+                if self._invalid.get(entry.name) == mtime_ns:
+                    invalid[entry.name] = mtime_ns
+                    continue
+                try:
+                    info = TaskInfo.from_file(Path(entry.path), mtime_ns)
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    # e.g. a file still being written
+                    logger.warning("Skipping task file %s: %r", entry.path, e)
+                    invalid[entry.name] = mtime_ns
+                    continue
+            tasks[entry.name] = info
+        self._tasks = dict(sorted(tasks.items()))
+        self._invalid = invalid
+
+    @property
+    def task_ids(self) -> List[str]:
+        return list(self._tasks)
+
+    @property
+    def max_num_train(self) -> int:
+        """Largest number of train examples of a task."""
+        return max(
+            (info.num_train for info in self._tasks.values()), default=1
+        )
+
+    @property
+    def saved(self) -> Set[str]:
+        return self._saved
+
+    def __getitem__(self, task_id: str) -> TaskInfo:
+        return self._tasks[task_id]
+
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._tasks
+
+    def is_saved(self, task_id: str) -> bool:
+        return task_id in self._saved
+
+    def search(
+        self,
+        query: str = "",
+        side_range: Optional[Tuple[int, int]] = None,
+        train_range: Optional[Tuple[int, int]] = None,
+        colors: Iterable[int] = (),
+        saved: Optional[bool] = None,
+    ) -> List[str]:
+        """Ids of the tasks matching all of the given filters.
+
+        `side_range` bounds the largest grid side of a task, `colors` must
+        all appear in it and `saved` selects tasks with or without a saved
+        fine-tuning example.
+        """
+        query = query.strip().lower()
+        required_colors = set(colors)
+        return [
+            task_id
+            for task_id, info in self._tasks.items()
+            if query in task_id.lower()
+            and (
+                side_range is None
+                or side_range[0] <= info.max_side <= side_range[1]
+            )
+            and (
+                train_range is None
+                or train_range[0] <= info.num_train <= train_range[1]
+            )
+            and required_colors <= info.colors
+            and (saved is None or (task_id in self._saved) == saved)
+        ]
@@ -1,38 +1,66 @@
-import asyncio
 import json
 import logging
-from os import listdir
 from pathlib import Path
-from typing import Any, List, Literal, Optional, cast
+from typing import Any, List, Optional
 
 import pandas as pd
-import plotly.express as px
 import streamlit as st
 from llama_index.core.workflow.handler import WorkflowHandler
-from llama_index.llms.openai import OpenAI
 
 from arc_finetuning_st.finetuning.finetuning_example import FineTuningExample
+from arc_finetuning_st.streamlit.background import (
+    WorkflowRun,
+    release_context,
+)
+from arc_finetuning_st.streamlit.figures import (
+    GridKind,
+    plot_grid,
+    render_prediction,
+    show_grid,
+)
+from arc_finetuning_st.streamlit.resources import SharedResources
 from arc_finetuning_st.workflows.arc_task_solver import (
     ARCTaskSolverWorkflow,
     WorkflowOutput,
 )
-from arc_finetuning_st.workflows.models import Attempt, Prediction
+from arc_finetuning_st.workflows.models import Attempt
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_LLM = "gpt-4o"
+
+
+def events_per_round(num_candidates: int) -> int:
+    """Events streamed by a one-round run of `num_candidates` candidates.
+
+    Start, then format task, prediction and evaluation of each candidate,
+    and stop.
+    """
+    return 2 + 3 * num_candidates
+
 
 class Controller:
-    def __init__(self) -> None:
+    """State of one user session: the current workflow run and its attempts.
+
+    One controller is kept per browser session, in `st.session_state`, while
+    everything reusable comes from the `SharedResources` of the process.
+    """
+
+    def __init__(
+        self, resources: SharedResources, llm: str = DEFAULT_LLM
+    ) -> None:
+        self._resources = resources
+        # e.g. "mock" to exercise the app without API calls
+        self._llm = llm
+        self._loop = resources.loop
+        self._workflow: Optional[ARCTaskSolverWorkflow] = None
+        self._run: Optional[WorkflowRun] = None
         self._handler: Optional[WorkflowHandler] = None
         self._attempts: List[Attempt] = []
         self._passing_results: List[bool] = []
-        self._data_path = Path(
-            Path(__file__).parents[2].absolute(), "data", "training"
-        )
-        self._finetuning_examples_path = Path(
-            Path(__file__).parents[2].absolute(), "finetuning_examples"
-        )
-        self._finetuning_examples_path.mkdir(exist_ok=True, parents=True)
+        self._data_path = resources.data_path
+        self._finetuning_examples_path = resources.finetuning_examples_path
+        self.catalog = resources.catalog
 
     def reset(self) -> None:
         # clear prediction
@@ -44,6 +72,11 @@ class Controller:
         st.session_state.critique = None
         st.session_state.metric_value = "N/A"
 
+        if self._run is not None:
+            self._run.cancel()
+        if self._workflow is not None and self._handler is not None:
+            release_context(self._workflow, self._handler.ctx)
+        self._run = None
         self._handler = None
         self._attempts = []
         self._passing_results = []
@@ -55,111 +88,145 @@ class Controller:
         self.reset()
 
     @staticmethod
-    def plot_grid(
-        grid: List[List[int]],
-        kind: Literal["input", "output", "prediction", "latest prediction"],
-    ) -> Any:
-        m = len(grid)
-        n = len(grid[0])
-        fig = px.imshow(
-            grid,
-            text_auto=True,
-            labels={"x": f"{kind.title()}<br><sup>{m}x{n}</sup>"},
+    def plot_grid(grid: List[List[int]], kind: GridKind) -> Any:
+        return plot_grid(grid, kind)
+
+    @property
+    def workflow(self) -> ARCTaskSolverWorkflow:
+        """The session's workflow, reused by all its runs."""
+        if self._workflow is None:
+            # one round per click, the human reviews the critique in between
+            self._workflow = ARCTaskSolverWorkflow(
+                timeout=None,
+                verbose=False,
+                llm=self._resources.llms.get(self._llm),
+                max_attempts=1,
+            )
+        return self._workflow
+
+    @property
+    def running(self) -> bool:
+        return self._run is not None and not self._run.done
+
+    def show_run_progress(self) -> None:
+        """Progress of the current run: one line per step with its timing."""
+        if self._run is None:
+            return
+        steps = self._run.poll()
+        st.progress(
+            min(
+                len(steps) / events_per_round(self.workflow.num_candidates),
+                1.0,
+            ),
+            text=(
+                f"{steps[-1].event} after {steps[-1].elapsed:.1f}s"
+                if steps
+                else "Workflow run in progress. Please wait."
+            ),
         )
-        fig.update_coloraxes(showscale=False)
-        fig.update_layout(
-            yaxis={"visible": False},
-            xaxis={"visible": True, "showticklabels": False},
-            margin=dict(
-                l=20,
-                r=20,
-                b=20,
-                t=20,
+        st.dataframe(
+            pd.DataFrame(
+                {
+                    "event": [s.event for s in steps],
+                    "candidate": [s.candidate_ix for s in steps],
+                    "step seconds": [round(s.duration, 2) for s in steps],
+                    "at": [round(s.elapsed, 2) for s in steps],
+                }
             ),
+            hide_index=True,
+            use_container_width=True,
         )
-        return fig
-
-    async def show_progress_bar(self, handler: WorkflowHandler) -> None:
-        progress_text_template = "{event} completed. Next step in progress."
-        my_bar = st.progress(0, text="Workflow run in progress. Please wait.")
-        num_steps = 5.0
-        current_step = 1
-        async for ev in handler.stream_events():
-            my_bar.progress(
-                current_step / num_steps,
-                text=progress_text_template.format(event=type(ev).__name__),
-            )
-            current_step += 1
-        my_bar.empty()
+        if self._run.done:
+            # apply the result with a full rerun, before widgets are drawn
+            st.rerun()
+        st.button("cancel", on_click=self.handle_cancel_click)
 
     def handle_abort_click(self) -> None:
         self.reset()
 
-    async def handle_prediction_click(self) -> None:
-        """Run workflow to generate prediction."""
-        selected_task = st.session_state.selected_task
-        if selected_task:
-            task = self.load_task(selected_task)
-            w = ARCTaskSolverWorkflow(
-                timeout=None, verbose=False, llm=OpenAI("gpt-4o")
-            )
-
-            if not self._handler:  # start a new solver
-                handler = w.run(task=task)
-
-            else:  # continuing from past Workflow execution
-                # need to reset this queue otherwise will use nested event loops
-                self._handler.ctx._streaming_queue = asyncio.Queue()
-
-                # use the critique and prediction str from streamlit
-                critique = st.session_state.get("critique")
-                self._attempts[-1].critique = critique
-                await self._handler.ctx.set("attempts", self._attempts)
-
-                # run Workflow
-                handler = w.run(ctx=self._handler.ctx, task=task)
-
-            # progress bar
-            _ = asyncio.create_task(self.show_progress_bar(handler))
+    def handle_cancel_click(self) -> None:
+        if self._run is not None:
+            self._run.cancel()
+            self._run = None
+        self._enable_buttons()
 
-            res: WorkflowOutput = await handler
+    def _enable_buttons(self) -> None:
+        started = self._handler is not None
+        st.session_state.disable_start_button = started
+        st.session_state.disable_continue_button = not started
 
-            handler = cast(WorkflowHandler, handler)
-            self._handler = handler
-            self._passing_results.append(res.passing)
-            self._attempts = res.attempts
-
-            # update streamlit states
-            grid = Prediction.prediction_str_to_int_array(
-                prediction=str(res.attempts[-1].prediction)
-            )
-            prediction_fig = Controller.plot_grid(
-                grid, kind="latest prediction"
+    def handle_prediction_click(self) -> None:
+        """Start a workflow run, one prediction round, in the background."""
+        selected_task = st.session_state.selected_task
+        if not selected_task or self.running:
+            return
+        task = self.load_task(selected_task)
+
+        if not self._handler:  # start a new solver
+            self._run = WorkflowRun(self._loop, self.workflow, task=task)
+        else:  # continuing from past Workflow execution
+            # use the critique and prediction str from streamlit
+            critique = st.session_state.get("critique")
+            self._attempts[-1].critique = critique
+            self._run = WorkflowRun(
+                self._loop,
+                self.workflow,
+                ctx=self._handler.ctx,
+                ctx_updates={"attempts": self._attempts},
+                task=task,
             )
-            st.session_state.prediction = prediction_fig
-            st.session_state.critique = str(res.attempts[-1].critique)
-            st.session_state.disable_continue_button = False
-            st.session_state.disable_abort_button = False
-            st.session_state.disable_preview_button = False
-            st.session_state.disable_start_button = True
-            metric_value = "✅" if res.passing else "❌"
-            st.session_state.metric_value = metric_value
+        st.session_state.run_error = None
+        st.session_state.disable_start_button = True
+        st.session_state.disable_continue_button = True
+
+    def collect_run(self) -> None:
+        """Apply the result of a finished run to the session state."""
+        if self._run is None or not self._run.done:
+            return
+        run, self._run = self._run, None
+        self._enable_buttons()
+        try:
+            res: WorkflowOutput = run.result()
+        except Exception as e:
+            logger.exception("Workflow run failed")
+            st.session_state.run_error = repr(e)
+            return
+
+        self._handler = run.handler
+        self._passing_results.append(res.passing)
+        self._attempts = res.attempts
+
+        # update streamlit states
+        # a malformed grid is shown as text rather than failing every rerun
+        st.session_state.prediction = render_prediction(
+            str(res.attempts[-1].prediction), kind="latest prediction"
+        )
+        st.session_state.critique = str(res.attempts[-1].critique)
+        st.session_state.disable_continue_button = False
+        st.session_state.disable_abort_button = False
+        st.session_state.disable_preview_button = False
+        st.session_state.disable_start_button = True
+        metric_value = "✅" if res.passing else "❌"
+        st.session_state.metric_value = metric_value
 
     @property
     def saved_finetuning_examples(self) -> List[str]:
-        return listdir(self._finetuning_examples_path)
+        return sorted(self.catalog.saved)
 
     @property
     def task_file_names(self) -> List[str]:
-        return listdir(self._data_path)
+        return self.catalog.task_ids
 
     def radio_format_task_name(self, selected_task: str) -> str:
-        if selected_task in self.saved_finetuning_examples:
+        if self.catalog.is_saved(selected_task):
             return f"{selected_task} ✅"
         return selected_task
 
+    def task_path(self, selected_task: str) -> Path:
+        return Path(self._data_path, selected_task)
+
     def load_task(self, selected_task: str) -> Any:
-        task_path = Path(self._data_path, selected_task)
+        task_path = self.task_path(selected_task)
 
         with open(task_path) as f:
             task = json.load(f)
@@ -213,11 +280,7 @@ class Controller:
         def _display_attempt(
             fig: Any, rationale: str, critique: str, passing: bool
         ) -> None:
-            st.plotly_chart(
-                fig,
-                use_container_width=True,
-                key="prediction",
-            )
+            show_grid(fig, kind="prediction", key="prediction")
             st.markdown(body=f"### Passing\n{passing}")
             st.markdown(body=f"### Rationale\n{rationale}")
             st.markdown(body=f"### Critique\n{critique}")
@@ -232,10 +295,9 @@ class Controller:
             row_ix = selected_rows[0]
             df_row = self.attempts_history_df.iloc[row_ix]
 
-            grid = Prediction.prediction_str_to_int_array(
-                prediction=df_row["prediction"]
+            prediction_fig = render_prediction(
+                df_row["prediction"], kind="prediction"
             )
-            prediction_fig = Controller.plot_grid(grid, kind="prediction")
 
             _display_attempt(
                 fig=prediction_fig,
@@ -244,10 +306,11 @@ class Controller:
                 passing=df_row["passing"],
             )
 
-    async def handle_finetuning_preview_click(self) -> None:
+    def handle_finetuning_preview_click(self) -> None:
         if self._handler:
             st.session_state.show_finetuning_preview_dialog = True
-            prompt_vars = await self._handler.ctx.get("prompt_vars")
+            # the context belongs to the background loop
+            prompt_vars = self._loop.run(self._handler.ctx.get("prompt_vars"))
 
             @st.dialog("Finetuning Example", width="large")
             def _display_finetuning_example() -> None:
@@ -0,0 +1,127 @@
+import json
+from pathlib import Path
+from typing import Any, List, Literal, Tuple
+
+import numpy as np
+import plotly.express as px
+import streamlit as st
+
+from arc_finetuning_st.workflows.grid import Grid
+
+GridKind = Literal["input", "output", "prediction", "latest prediction"]
+
+# one colour per ARC colour value, shared by all grids so values look the same
+# across inputs, outputs and predictions
+ARC_COLORS = [
+    "#000000",
+    "#0074d9",
+    "#ff4136",
+    "#2ecc40",
+    "#ffdc00",
+    "#aaaaaa",
+    "#f012be",
+    "#ff851b",
+    "#7fdbff",
+    "#870c25",
+]
+ARC_COLORSCALE = [
+    [edge, color]
+    for ix, color in enumerate(ARC_COLORS)
+    for edge in (ix / len(ARC_COLORS), (ix + 1) / len(ARC_COLORS))
+]
+_PALETTE = np.array(
+    [[int(c[i : i + 2], 16) for i in (1, 3, 5)] for c in ARC_COLORS],
+    dtype=np.uint8,
+)
+
+# grids with more cells are drawn as images: an annotated Plotly heatmap
+# gets slow to build and to render with hundreds of cells
+MAX_FIGURE_CELLS = 225
+IMAGE_CELL_PX = 16
+# figures kept by the cache, about 2 per train example plus 1 per test case
+FIGURE_CACHE_ENTRIES = 512
+
+
+def plot_grid(grid: List[List[int]], kind: GridKind) -> Any:
+    m = len(grid)
+    n = len(grid[0])
+    fig = px.imshow(
+        grid,
+        text_auto=True,
+        zmin=0,
+        zmax=len(ARC_COLORS) - 1,
+        color_continuous_scale=ARC_COLORSCALE,
+        labels={"x": f"{kind.title()}<br><sup>{m}x{n}</sup>"},
+    )
+    fig.update_coloraxes(showscale=False)
+    fig.update_layout(
+        yaxis={"visible": False},
+        xaxis={"visible": True, "showticklabels": False},
+        margin=dict(
+            l=20,
+            r=20,
+            b=20,
+            t=20,
+        ),
+    )
+    return fig
+
+
+def grid_image(grid: Grid, cell_px: int = IMAGE_CELL_PX) -> np.ndarray:
+    """RGB image of the grid, `cell_px` pixels per cell with 1 pixel gaps."""
+    rgb = _PALETTE[np.minimum(grid.array, len(ARC_COLORS) - 1)]
+    image = np.repeat(np.repeat(rgb, cell_px, axis=0), cell_px, axis=1)
+    # grid lines between cells
+    image[cell_px - 1 :: cell_px, :] = 64
+    image[:, cell_px - 1 :: cell_px] = 64
+    return image
+
+
+def render_grid(grid: List[List[int]], kind: GridKind) -> Tuple[str, Any]:
+    """("plotly", figure) for small grids, ("image", RGB array) for large ones."""
+    if len(grid) * len(grid[0]) > MAX_FIGURE_CELLS:
+        return "image", grid_image(Grid.from_list(grid))
+    return "plotly", plot_grid(grid, kind)
+
+
+def render_prediction(prediction: str, kind: GridKind) -> Tuple[str, Any]:
+    """Like `render_grid` for a predicted grid string, ("text", prediction) if malformed."""
+    try:
+        grid = Grid.parse(prediction).tolist()
+    except ValueError:
+        return "text", prediction
+    return render_grid(grid, kind)
+
+
+@st.cache_resource(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def task_grid_figure(
+    task_path: Path,
+    mtime_ns: int,
+    split: Literal["train", "test"],
+    index: int,
+    kind: GridKind,
+) -> Tuple[str, Any]:
+    """Rendered grid of a task, cached for all sessions by (task, split, index, kind).
+
+    `mtime_ns` of the task file is part of the key, so an edited file is
+    rendered again. Entries are shared rather than copied on each hit like
+    `st.cache_data` would, so they must not be mutated.
+    """
+    with open(task_path) as f:
+        task = json.load(f)
+    return render_grid(task[split][index][kind], kind)
+
+
+def show_grid(
+    rendered: Tuple[str, Any], kind: GridKind, **kwargs: Any
+) -> None:
+    """Display a grid rendered by `render_grid` or `task_grid_figure`."""
+    fmt, fig = rendered
+    if fmt == "plotly":
+        st.plotly_chart(fig, use_container_width=True, **kwargs)
+    elif fmt == "text":
+        st.warning(f"The {kind} is not a valid grid.")
+        st.code(fig)
+    else:
+        height, width = (size // IMAGE_CELL_PX for size in fig.shape[:2])
+        st.image(fig, caption=f"{kind.title()} {height}x{width}")
@@ -0,0 +1,35 @@
+from pathlib import Path
+from typing import Optional
+
+from arc_finetuning_st.llms.registry import LLMRegistry
+from arc_finetuning_st.streamlit.background import BackgroundLoop
+from arc_finetuning_st.streamlit.catalog import TaskCatalog
+
+DATA_PATH = Path(Path(__file__).parents[2].absolute(), "data", "training")
+FINETUNING_EXAMPLES_PATH = Path(
+    Path(__file__).parents[2].absolute(), "finetuning_examples"
+)
+
+
+class SharedResources:
+    """Resources shared by all sessions of the app, each safe to use concurrently.
+
+    Holds the LLM clients, the task catalog and the background loop that all
+    workflow runs execute on. Rendered grids are shared through the
+    `task_grid_figure` cache. Session state, i.e. runs and attempts, lives
+    in each session's `Controller`.
+    """
+
+    def __init__(
+        self,
+        data_path: Path = DATA_PATH,
+        finetuning_examples_path: Path = FINETUNING_EXAMPLES_PATH,
+        llms: Optional[LLMRegistry] = None,
+        loop: Optional[BackgroundLoop] = None,
+    ) -> None:
+        self.data_path = data_path
+        self.finetuning_examples_path = finetuning_examples_path
+        self.finetuning_examples_path.mkdir(exist_ok=True, parents=True)
+        self.catalog = TaskCatalog(data_path, finetuning_examples_path)
+        self.llms = llms or LLMRegistry()
+        self.loop = loop or BackgroundLoop()
@@ -0,0 +1,182 @@
+"""Concurrency test: N simulated sessions solving tasks in one app process.
+
+Each session is an `AppTest` of app.py, with its own session state, driven
+from its own thread like a browser tab. It selects a task, clicks start and
+polls until the run is applied, then clicks continue for the remaining
+rounds. All sessions share the process' `SharedResources`, so their
+workflow runs overlap on the shared background loop. AppTest itself is not
+thread-safe, so script reruns are serialized. The LLM is the
+offline mock, whose predictions keep the shape of the task's test input, so
+a session that picked up another session's run is caught.
+
+    python -m arc_finetuning_st.streamlit.session_load_test --sessions 8 --rounds 3
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+from arc_finetuning_st.llms.mock import MOCK_LLM_NAME
+from arc_finetuning_st.streamlit.catalog import TaskCatalog
+from arc_finetuning_st.streamlit.resources import (
+    DATA_PATH,
+    FINETUNING_EXAMPLES_PATH,
+)
+from arc_finetuning_st.workflows.grid import Grid
+
+APP_PATH = str(Path(Path(__file__).parent, "app.py"))
+# AppTest sets up a process-wide runtime for each script run
+_RERUN_LOCK = threading.Lock()
+
+
+def _rerun(at: AppTest) -> float:
+    """Rerun the session's script, returning the seconds the rerun took."""
+    with _RERUN_LOCK:
+        start = time.perf_counter()
+        at.run()
+        return time.perf_counter() - start
+
+
+def _button(at: AppTest, label: str) -> Any:
+    return next(b for b in at.button if b.label == label)
+
+
+def run_session(
+    task_id: str,
+    rounds: int,
+    poll_interval: float,
+    timeout: float,
+    report: Dict[str, Any],
+) -> None:
+    """Solve `rounds` rounds of a task as one user, recording into `report`."""
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    _rerun(at)
+    tasks_radio = next(r for r in at.sidebar.radio if r.label == "Tasks")
+    tasks_radio.set_value(task_id)
+    _rerun(at)
+
+    round_seconds: List[float] = []
+    rerun_seconds: List[float] = []
+    for round_ix in range(rounds):
+        start = time.perf_counter()
+        _button(at, "start" if round_ix == 0 else "continue").click()
+        _rerun(at)
+        while any(b.label == "cancel" for b in at.button):
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"Round {round_ix + 1} of {task_id}")
+            time.sleep(poll_interval)
+            rerun_seconds.append(_rerun(at))
+        round_seconds.append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        if at.session_state["run_error"]:
+            raise RuntimeError(at.session_state["run_error"])
+
+    controller = at.session_state["controller"]
+    with open(Path(DATA_PATH, task_id)) as f:
+        expected_shape = Grid.from_list(json.load(f)["test"][0]["input"]).shape
+    shapes = [a.prediction.to_grid().shape for a in controller._attempts]
+    report.update(
+        round_seconds=round_seconds,
+        rerun_seconds=rerun_seconds,
+        attempts=len(controller._attempts),
+        own_predictions=all(shape == expected_shape for shape in shapes),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=0.5,
+        help="Seconds between reruns while a run is in progress, like the app's fragment.",
+    )
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    # picked up by app.py when creating each session's controller
+    os.environ["ARC_LLM"] = MOCK_LLM_NAME
+    task_ids = TaskCatalog(DATA_PATH, FINETUNING_EXAMPLES_PATH).task_ids
+    if not task_ids:
+        raise SystemExit(f"No tasks in {DATA_PATH}, see the README.")
+
+    reports: List[Dict[str, Any]] = [
+        {"task_id": task_ids[ix % len(task_ids)]}
+        for ix in range(args.sessions)
+    ]
+    errors: List[str] = []
+
+    def _session(report: Dict[str, Any]) -> None:
+        try:
+            run_session(
+                report["task_id"],
+                args.rounds,
+                args.poll_interval,
+                args.timeout,
+                report,
+            )
+        except Exception as e:
+            errors.append(f"{report['task_id']}: {e!r}")
+
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=_session, args=(report,)) for report in reports
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    completed = [r for r in reports if "attempts" in r]
+    round_seconds = [s for r in completed for s in r["round_seconds"]]
+    rerun_seconds = [s for r in completed for s in r["rerun_seconds"]]
+    cross_talk = [
+        r["task_id"]
+        for r in completed
+        if r["attempts"] != args.rounds or not r["own_predictions"]
+    ]
+    print(
+        json.dumps(
+            {
+                "sessions": args.sessions,
+                "rounds": args.rounds,
+                "completed_sessions": len(completed),
+                "errors": errors,
+                "sessions_with_cross_talk": cross_talk,
+                "wall_seconds": round(elapsed, 2),
+                "round_p50_s": (
+                    round(float(np.median(round_seconds)), 2)
+                    if round_seconds
+                    else None
+                ),
+                "round_p95_s": (
+                    round(float(np.percentile(round_seconds, 95)), 2)
+                    if round_seconds
+                    else None
+                ),
+                "rerun_p95_s": (
+                    round(float(np.percentile(rerun_seconds, 95)), 3)
+                    if rerun_seconds
+                    else None
+                ),
+            },
+            indent=2,
+        )
+    )
+    if errors or cross_talk or len(completed) != args.sessions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
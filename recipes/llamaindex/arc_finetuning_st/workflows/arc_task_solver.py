@@ -1,10 +1,13 @@
 import asyncio
 import json
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional, cast
+from typing import Any, Dict, List, Optional, Tuple, Type, cast
 
 from llama_index.core.bridge.pydantic import BaseModel
 from llama_index.core.llms import LLM
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.utils import get_tokenizer
 from llama_index.core.workflow import (
     Context,
     StartEvent,
@@ -13,11 +16,18 @@ from llama_index.core.workflow import (
     step,
 )
 
+from arc_finetuning_st.llms.cache import LLMCache
+from arc_finetuning_st.llms.rate_limit import (
+    RateLimiter,
+    retry_on_transient_error,
+)
 from arc_finetuning_st.workflows.events import (
+    CorrectionEvent,
     EvaluationEvent,
     FormatTaskEvent,
     PredictionEvent,
 )
+from arc_finetuning_st.workflows.grid import Grid, TaskGrids
 from arc_finetuning_st.workflows.models import Attempt, Critique, Prediction
 from arc_finetuning_st.workflows.prompts import (
     CORRECTION_PROMPT_TEMPLATE,
@@ -46,16 +56,63 @@ CRITIQUE:
 """
 
 
+# upper bound on best-of-N candidates, i.e. concurrent prediction/reflection workers
+MAX_CANDIDATES = 8
+# completion tokens reserved from the tokens/min budget before each LLM call
+COMPLETION_TOKENS_ESTIMATE = 512
+
+
 class WorkflowOutput(BaseModel):
     passing: bool
     attempts: List[Attempt]
 
 
 class ARCTaskSolverWorkflow(Workflow):
-    def __init__(self, llm: LLM, max_attempts: int = 3, **kwargs: Any) -> None:
+    """Predict, evaluate and reflect on an ARC task.
+
+    A run makes up to `max_attempts` rounds of prediction, evaluation and
+    reflection, feeding each round's critiques into the next round's
+    correction, and stops at the first passing prediction. Pass
+    `max_attempts=1` to make one round per run, e.g. to let a human edit the
+    critique before continuing with the same context.
+
+    With `num_candidates` > 1 each round fans out that many independent
+    predictions concurrently (best-of-N). All are evaluated and only failing
+    candidates are critiqued. Candidates after the first are sampled at
+    `candidate_temperature` so that they differ.
+
+    LLM calls wait on the optional `rate_limiter` and are retried with
+    backoff, up to `max_retries` times, when the API answers 429 or a transient
+    5xx error, or times out.
+
+    With a `cache`, structured outputs are looked up before calling the LLM
+    and stored after, so replaying tasks costs no API calls. Leave it unset
+    to bypass caching.
+    """
+
+    def __init__(
+        self,
+        llm: LLM,
+        max_attempts: int = 3,
+        num_candidates: int = 1,
+        candidate_temperature: float = 0.7,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_retries: int = 5,
+        cache: Optional[LLMCache] = None,
+        **kwargs: Any,
+    ) -> None:
         super().__init__(**kwargs)
+        if not 1 <= num_candidates <= MAX_CANDIDATES:
+            raise ValueError(
+                f"num_candidates must be between 1 and {MAX_CANDIDATES}."
+            )
         self.llm = llm
         self._max_attempts = max_attempts
+        self._num_candidates = num_candidates
+        self._candidate_temperature = candidate_temperature
+        self._rate_limiter = rate_limiter
+        self._max_retries = max_retries
+        self.cache = cache
 
     def _format_past_attempt(self, attempt: Attempt, attempt_num: int) -> str:
         return PAST_ATTEMPT_TEMPLATE.format(
@@ -64,125 +121,253 @@ class ARCTaskSolverWorkflow(Workflow):
             past_critique=str(attempt.critique) if attempt.critique else "",
         )
 
+    def _format_past_attempts(self, attempts: List[Attempt]) -> str:
+        return "\n".join(
+            self._format_past_attempt(a, ix + 1)
+            for ix, a in enumerate(attempts)
+        )
+
+    @property
+    def num_candidates(self) -> int:
+        """Candidate predictions made in each round."""
+        return self._num_candidates
+
+    def _candidate_llm(self, candidate_ix: int) -> LLM:
+        """The first candidate uses the LLM as given, the others sample more freely."""
+        if candidate_ix == 0 or not hasattr(self.llm, "temperature"):
+            return self.llm
+        return self.llm.model_copy(
+            update={"temperature": self._candidate_temperature}
+        )
+
+    async def _astructured_predict(
+        self,
+        llm: LLM,
+        output_cls: Type[BaseModel],
+        prompt: PromptTemplate,
+        sample: int = 0,
+        **prompt_vars: Any,
+    ) -> Tuple[Any, int, int]:
+        """Structured predict, returning the output with its prompt and completion token counts.
+
+        Counts are estimated with the default tokenizer since structured
+        predictions do not expose the LLM's usage. `sample` is the candidate
+        index, so that cached candidates of one prompt stay distinct.
+        """
+        tokenizer = get_tokenizer()
+        prompt_tokens = len(tokenizer(prompt.format(**prompt_vars)))
+
+        cache_key = None
+        if self.cache:
+            cache_key = LLMCache.key(
+                llm, output_cls, prompt, prompt_vars, sample=sample
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                output = output_cls.model_validate_json(cached)
+                return output, prompt_tokens, len(tokenizer(cached))
+
+        async def _predict() -> Any:
+            if self._rate_limiter:
+                await self._rate_limiter.acquire(
+                    prompt_tokens + COMPLETION_TOKENS_ESTIMATE
+                )
+            return await llm.astructured_predict(
+                output_cls, prompt, **prompt_vars
+            )
+
+        output = await retry_on_transient_error(
+            _predict,
+            max_retries=self._max_retries,
+            limiter=self._rate_limiter,
+        )
+        output_json = output.model_dump_json()
+        if self.cache and cache_key is not None:
+            self.cache.set(cache_key, output_json)
+        completion_tokens = len(tokenizer(output_json))
+        return output, prompt_tokens, completion_tokens
+
+    async def _start_round(self, ctx: Context) -> None:
+        # critiqued candidates of this round, by candidate index
+        await ctx.set("candidates", {})
+        for candidate_ix in range(self._num_candidates):
+            ctx.send_event(FormatTaskEvent(candidate_ix=candidate_ix))
+
     @step
     async def format_task(
         self, ctx: Context, ev: StartEvent
-    ) -> FormatTaskEvent:
+    ) -> FormatTaskEvent | None:
         ctx.write_event_to_stream(ev)
 
-        def _format_row(row: List[int]) -> str:
-            return ",".join(str(el) for el in row)
-
-        def pretty_print_grid(grid: List[List[int]]) -> str:
-            formatted_rows = [_format_row(row) for row in grid]
-            return "\n".join(formatted_rows)
-
-        def format_train_example(train_pair: Dict) -> str:
-            return EXAMPLE_TEMPLATE.format(
-                input=pretty_print_grid(train_pair["input"]),
-                output=pretty_print_grid(train_pair["output"]),
-            )
-
         task = ev.get("task", {})
         await ctx.set("task", task)
+        # set by the first passing candidate, the others are then dropped
+        await ctx.set("stopped", asyncio.Event())
 
         # prepare prompt_vars
         attempts = await ctx.get("attempts", [])
         if attempts:
             # update past predictions
             prompt_vars = await ctx.get("prompt_vars")
-            formatted_past_attempts = [
-                self._format_past_attempt(a, ix + 1)
-                for ix, a in enumerate(attempts)
-            ]
             prompt_vars.update(
-                past_attempts="\n".join(formatted_past_attempts)
+                past_attempts=self._format_past_attempts(attempts)
             )
         else:
-            examples = [format_train_example(t) for t in task["train"]]
+            # parsed once, kept for runs continuing from this context
+            grids = TaskGrids(task)
+            await ctx.set("grids", grids)
             prompt_vars = {
-                "test_input": pretty_print_grid(task["test"][0]["input"]),
-                "examples": "\n".join(examples),
+                "test_input": str(grids.test_input),
+                "examples": "\n".join(
+                    EXAMPLE_TEMPLATE.format(input=input_, output=output)
+                    for input_, output in grids.train
+                ),
             }
             await ctx.set("prompt_vars", prompt_vars)
 
-        return FormatTaskEvent()
+        # rounds are numbered across runs continuing from the same context
+        first_round = max((a.round for a in attempts), default=0) + 1
+        await ctx.set("round", first_round)
+        await ctx.set("last_round", first_round + self._max_attempts - 1)
+        await self._start_round(ctx)
+        return None
 
     @step
+    async def correction(
+        self, ctx: Context, ev: CorrectionEvent
+    ) -> FormatTaskEvent | None:
+        ctx.write_event_to_stream(ev)
+        await ctx.set("round", await ctx.get("round") + 1)
+        await self._start_round(ctx)
+        return None
+
+    @step(num_workers=MAX_CANDIDATES)
     async def prediction(
         self, ctx: Context, ev: FormatTaskEvent
-    ) -> PredictionEvent | StopEvent:
+    ) -> PredictionEvent:
         ctx.write_event_to_stream(ev)
         attempts = await ctx.get("attempts", [])
         attempts = cast(List[Attempt], attempts)
         prompt_vars = await ctx.get("prompt_vars")
+        llm = self._candidate_llm(ev.candidate_ix)
 
+        start = time.perf_counter()
         if attempts:
-            # generating a correction from last Workflow run
-            correction: Prediction = await self.llm.astructured_predict(
-                Prediction, CORRECTION_PROMPT_TEMPLATE, **prompt_vars
+            # generating a correction from past attempts and critiques
+            pred, prompt_tokens, completion_tokens = (
+                await self._astructured_predict(
+                    llm,
+                    Prediction,
+                    CORRECTION_PROMPT_TEMPLATE,
+                    sample=ev.candidate_ix,
+                    **prompt_vars,
+                )
             )
-            attempts.append(Attempt(prediction=correction))
         else:
-            # starting a new correction with no previous Workflow runs
-            pred: Prediction = await self.llm.astructured_predict(
-                Prediction, PREDICTION_PROMPT_TEMPLATE, **prompt_vars
+            # starting a new correction with no previous attempts
+            pred, prompt_tokens, completion_tokens = (
+                await self._astructured_predict(
+                    llm,
+                    Prediction,
+                    PREDICTION_PROMPT_TEMPLATE,
+                    sample=ev.candidate_ix,
+                    **prompt_vars,
+                )
             )
-            attempts = [Attempt(prediction=pred)]
 
-        await ctx.set("attempts", attempts)
-        return PredictionEvent()
+        attempt = Attempt(
+            prediction=pred,
+            round=await ctx.get("round"),
+            latency=time.perf_counter() - start,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+        return PredictionEvent(candidate_ix=ev.candidate_ix, attempt=attempt)
 
     @step
     async def evaluation(
         self, ctx: Context, ev: PredictionEvent
     ) -> EvaluationEvent:
         ctx.write_event_to_stream(ev)
-        task = await ctx.get("task")
-        attempts: List[Attempt] = await ctx.get("attempts")
-        latest_prediction = attempts[-1].prediction
-        latest_prediction_as_array = Prediction.prediction_str_to_int_array(
-            str(latest_prediction)
-        )
-        ground_truth = task["test"][0]["output"]
+        grids: TaskGrids = await ctx.get("grids")
+        try:
+            predicted = ev.attempt.prediction.to_grid()
+        except ValueError:
+            # a malformed grid is scored as failing, not raised
+            predicted = None
+        ground_truth = cast(Grid, grids.test_output)
+        if predicted is not None:
+            ev.attempt.accuracy = predicted.accuracy(ground_truth)
 
         return EvaluationEvent(
-            passing=(latest_prediction_as_array == ground_truth)
+            passing=(predicted == ground_truth),
+            candidate_ix=ev.candidate_ix,
+            attempt=ev.attempt,
         )
 
-    @step
-    async def reflection(self, ctx: Context, ev: EvaluationEvent) -> StopEvent:
+    @step(num_workers=MAX_CANDIDATES)
+    async def reflection(
+        self, ctx: Context, ev: EvaluationEvent
+    ) -> CorrectionEvent | StopEvent | None:
         ctx.write_event_to_stream(ev)
-        attempts = await ctx.get("attempts")
+        attempts = await ctx.get("attempts", [])
         attempts = cast(List[Attempt], attempts)
-        latest_attempt = attempts[-1]
-
-        # check if passing
-        if not ev.passing:
-            prompt_vars = await ctx.get("prompt_vars")
-            formatted_past_attempts = [
-                self._format_past_attempt(a, ix + 1)
-                for ix, a in enumerate(attempts)
-            ]
-            prompt_vars.update(
-                past_attempts="\n".join(formatted_past_attempts)
+        attempt = ev.attempt
+        attempt.passing = ev.passing
+
+        stopped: asyncio.Event = await ctx.get("stopped")
+        if ev.passing:
+            # stop early, outstanding candidates are cancelled with the run.
+            # Only the first passing candidate of a round is recorded: the
+            # check and set don't yield, so no other candidate interleaves.
+            async with ctx.lock:
+                first = not stopped.is_set()
+                stopped.set()
+            if not first:
+                return None
+            attempt.critique = "This predicted output is correct."
+            attempts = attempts + [attempt]
+            await ctx.set("attempts", attempts)
+            return StopEvent(
+                result=WorkflowOutput(passing=True, attempts=attempts)
             )
 
-            # generate critique
-            critique: Critique = await self.llm.astructured_predict(
-                Critique, REFLECTION_PROMPT_TEMPLATE, **prompt_vars
+        prompt_vars = await ctx.get("prompt_vars")
+        critique_vars = {
+            **prompt_vars,
+            "past_attempts": self._format_past_attempts(attempts + [attempt]),
+        }
+
+        # generate critique
+        start = time.perf_counter()
+        critique, prompt_tokens, completion_tokens = (
+            await self._astructured_predict(
+                self.llm,
+                Critique,
+                REFLECTION_PROMPT_TEMPLATE,
+                sample=ev.candidate_ix,
+                **critique_vars,
             )
-
-            # update states
-            latest_attempt.critique = critique
-        else:
-            latest_attempt.critique = "This predicted output is correct."
-
-        latest_attempt.passing = ev.passing
-        attempts[-1] = latest_attempt
+        )
+        attempt.critique = critique
+        attempt.latency += time.perf_counter() - start
+        attempt.prompt_tokens += prompt_tokens
+        attempt.completion_tokens += completion_tokens
+
+        candidates: Dict[int, Attempt] = await ctx.get("candidates")
+        candidates[ev.candidate_ix] = attempt
+        if stopped.is_set() or len(candidates) < self._num_candidates:
+            return None
+
+        # update states
+        attempts = attempts + [candidates[ix] for ix in sorted(candidates)]
+        prompt_vars.update(past_attempts=self._format_past_attempts(attempts))
         await ctx.set("attempts", attempts)
 
-        result = WorkflowOutput(passing=ev.passing, attempts=attempts)
+        if await ctx.get("round") < await ctx.get("last_round"):
+            return CorrectionEvent()
+
+        result = WorkflowOutput(passing=False, attempts=attempts)
         return StopEvent(result=result)
 
     async def load_and_run_task(
@@ -214,7 +399,7 @@ async def _test_workflow() -> None:
     import json
     from pathlib import Path
 
-    from llama_index.llms.openai import OpenAI
+    from arc_finetuning_st.llms.registry import LLMRegistry
 
     task_path = Path(
         Path(__file__).parents[2].absolute(), "data/training/0a938d79.json"
@@ -223,7 +408,7 @@ async def _test_workflow() -> None:
         task = json.load(f)
 
     w = ARCTaskSolverWorkflow(
-        timeout=None, verbose=False, llm=OpenAI("gpt-4o")
+        timeout=None, verbose=False, llm=LLMRegistry().get("gpt-4o")
     )
     attempts = await w.run(task=task)
 
@@ -1,17 +1,21 @@
 from llama_index.core.workflow import Event
 
+from arc_finetuning_st.workflows.models import Attempt
+
 
 class FormatTaskEvent(Event):
-    ...
+    candidate_ix: int = 0
 
 
 class PredictionEvent(Event):
-    ...
+    candidate_ix: int = 0
+    attempt: Attempt
 
 
 class EvaluationEvent(Event):
     passing: bool
+    candidate_ix: int = 0
+    attempt: Attempt
 
 
-class CorrectionEvent(Event):
-    ...
+class CorrectionEvent(Event): ...
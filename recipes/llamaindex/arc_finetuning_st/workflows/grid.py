@@ -0,0 +1,139 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_COMMA, _NEWLINE, _ZERO = ord(","), ord("\n"), ord("0")
+
+
+class Grid:
+    """An ARC grid of colours 0-9, backed by a 2D uint8 array.
+
+    Grids are written as rows of comma separated cells, one row per line,
+    e.g. '0,0,1\\n1,1,1'. Parsing and formatting work on the whole byte
+    string at once, and the formatted string is kept once computed.
+    """
+
+    __slots__ = ("array", "_text")
+
+    def __init__(self, array: Any) -> None:
+        array = np.asarray(array)
+        if array.ndim != 2 or array.size == 0:
+            raise ValueError(f"Grid must be 2D and non-empty: {array!r}")
+        if array.dtype != np.uint8:
+            if array.min() < 0 or array.max() > 255:
+                raise ValueError("Grid cells must be between 0 and 255.")
+            array = array.astype(np.uint8)
+        self.array = array
+        self._text: Optional[str] = None
+
+    @classmethod
+    def from_list(cls, rows: List[List[int]]) -> "Grid":
+        try:
+            return cls(np.array(rows, dtype=np.int64))
+        except ValueError as e:
+            # ragged rows
+            raise ValueError(f"Invalid grid: {rows!r}") from e
+
+    @classmethod
+    def parse(cls, text: str) -> "Grid":
+        """Parse a grid string, raising ValueError if it is malformed."""
+        text = text.strip()
+        buf = np.frombuffer(text.encode(), dtype=np.uint8)
+        # fast path: single digit cells, so digits and separators alternate
+        if buf.size % 2 == 1:
+            digits, seps = buf[::2], buf[1::2]
+            row_ends = np.flatnonzero(seps == _NEWLINE)
+            width = row_ends[0] + 1 if row_ends.size else digits.size
+            if (
+                np.all((digits >= _ZERO) & (digits <= _ZERO + 9))
+                and np.all((seps == _COMMA) | (seps == _NEWLINE))
+                and digits.size % width == 0
+                and np.array_equal(
+                    row_ends,
+                    np.arange(width - 1, digits.size - 1, width),
+                )
+            ):
+                grid = cls((digits - _ZERO).reshape(-1, width))
+                grid._text = text
+                return grid
+        # anything else, e.g. spaces or multi-digit cells
+        try:
+            rows = [
+                [int(cell) for cell in line.split(",")]
+                for line in text.split("\n")
+            ]
+        except ValueError as e:
+            raise ValueError(f"Invalid grid: {text!r}") from e
+        return cls.from_list(rows)
+
+    def format(self) -> str:
+        if self._text is None:
+            if self.array.max() <= 9:
+                height, width = self.array.shape
+                out = np.full((height, 2 * width), _COMMA, dtype=np.uint8)
+                out[:, ::2] = self.array + _ZERO
+                out[:, -1] = _NEWLINE
+                self._text = out.tobytes()[:-1].decode()
+            else:
+                self._text = "\n".join(
+                    ",".join(str(cell) for cell in row)
+                    for row in self.array.tolist()
+                )
+        return self._text
+
+    def __str__(self) -> str:
+        return self.format()
+
+    def __repr__(self) -> str:
+        return f"Grid({self.array.tolist()!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Grid):
+            return NotImplemented
+        return self.shape == other.shape and bool(
+            np.array_equal(self.array, other.array)
+        )
+
+    __hash__ = None  # type: ignore[assignment]
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.array.shape
+
+    def tolist(self) -> List[List[int]]:
+        return self.array.tolist()
+
+    def diff_mask(self, other: "Grid") -> np.ndarray:
+        """Boolean mask over this grid of the cells that differ from `other`.
+
+        Cells outside of `other` count as different.
+        """
+        mask = np.ones(self.shape, dtype=bool)
+        height = min(self.shape[0], other.shape[0])
+        width = min(self.shape[1], other.shape[1])
+        mask[:height, :width] = (
+            self.array[:height, :width] != other.array[:height, :width]
+        )
+        return mask
+
+    def accuracy(self, target: "Grid") -> float:
+        """Fraction of cells equal to `target`'s, 0.0 if the shapes differ."""
+        if self.shape != target.shape:
+            return 0.0
+        return float(np.mean(self.array == target.array))
+
+
+class TaskGrids:
+    """The grids of an ARC task, parsed once per run."""
+
+    def __init__(self, task: Dict[str, Any]) -> None:
+        self.train = [
+            (Grid.from_list(pair["input"]), Grid.from_list(pair["output"]))
+            for pair in task["train"]
+        ]
+        self.test_input = Grid.from_list(task["test"][0]["input"])
+        self.test_output: Optional[Grid] = (
+            Grid.from_list(task["test"][0]["output"])
+            if "output" in task["test"][0]
+            else None
+        )
@@ -3,6 +3,8 @@ from typing import List, Optional
 
 from llama_index.core.bridge.pydantic import BaseModel, Field
 
+from arc_finetuning_st.workflows.grid import Grid
+
 
 class Prediction(BaseModel):
     """Prediction data class for LLM structured predict."""
@@ -19,9 +21,11 @@ class Prediction(BaseModel):
 
     @staticmethod
     def prediction_str_to_int_array(prediction: str) -> List[List[int]]:
-        return [
-            [int(a) for a in el.split(",")] for el in prediction.split("\n")
-        ]
+        return Grid.parse(prediction).tolist()
+
+    def to_grid(self) -> Grid:
+        """The predicted grid, raising ValueError if it is malformed."""
+        return Grid.parse(self.prediction)
 
 
 class Critique(BaseModel):
@@ -42,3 +46,16 @@ class Attempt(BaseModel):
     prediction: Prediction
     critique: Optional[Critique] = Field(default=None)
     passing: bool = Field(default=False)
+    accuracy: float = Field(
+        default=0.0,
+        description="Fraction of predicted cells matching the expected output.",
+    )
+    round: int = Field(
+        default=1, description="Prediction round the attempt was made in."
+    )
+    latency: float = Field(
+        default=0.0,
+        description="Seconds spent on the prediction and critique LLM calls.",
+    )
+    prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
@@ -0,0 +1,97 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_DONE = object()
+
+
+class BackgroundLoop:
+    """An asyncio event loop running on a daemon thread, shared by all sessions.
+
+    Async clients (Weaviate, Cohere) are created and used only on this loop, so
+    their connection pools are reused across sessions while each Streamlit
+    script thread just waits on futures.
+    """
+
+    def __init__(self, name="search-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block the calling thread for its result"""
+        return self.submit(coro).result(timeout)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class SearchRun:
+    """Retrieval and generation of one search, running on the background loop.
+
+    Generation starts on the loop as soon as retrieval returns, so it overlaps
+    with the script thread rendering the results. `movies()` waits for the
+    retrieval only; `tokens()` yields generated text as it arrives.
+
+    retrieve is a coroutine returning the movies; generate is called with the
+    movies and returns an async iterator of tokens, or None to skip generation.
+    """
+
+    def __init__(self, loop, retrieve, generate):
+        self.search_ms = None
+        self.first_token_ms = None
+        self.generation_ms = None
+        self._movies = Future()
+        self._tokens = queue.Queue()
+        self._future = loop.submit(self._run(retrieve, generate))
+
+    async def _run(self, retrieve, generate):
+        start = time.perf_counter()
+        try:
+            movies = await retrieve
+        except Exception as e:
+            self._movies.set_exception(e)
+            self._tokens.put(_DONE)
+            return
+        self.search_ms = (time.perf_counter() - start) * 1000
+        self._movies.set_result(movies)
+
+        tokens = generate(movies) if movies else None
+        if tokens is None:
+            self._tokens.put(_DONE)
+            return
+        start = time.perf_counter()
+        try:
+            async for token in tokens:
+                if self.first_token_ms is None:
+                    self.first_token_ms = (time.perf_counter() - start) * 1000
+                self._tokens.put(token)
+            self.generation_ms = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            self._tokens.put(e)
+        finally:
+            self._tokens.put(_DONE)
+
+    def movies(self, timeout=None):
+        return self._movies.result(timeout)
+
+    def tokens(self):
+        """Yield generated tokens from the calling thread, re-raising generation errors"""
+        while True:
+            item = self._tokens.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        self._future.cancel()
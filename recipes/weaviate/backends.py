@@ -0,0 +1,563 @@
+import abc
+import asyncio
+import hashlib
+import math
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import weaviate
+from weaviate.classes.init import AdditionalConfig, Auth
+from weaviate.classes.query import Filter, MetadataQuery
+from weaviate.config import ConnectionConfig
+
+from helpers.movie_stream import build_properties, decade_of, decade_tenant, iter_chunks, iter_movie_records
+
+COLLECTION_NAME = "MovieDemo"
+# Collection loaded with `add_data.py --partition`, one tenant per decade
+PARTITIONED_COLLECTION_NAME = "MovieDemoByDecade"
+FIRST_YEAR = 1950
+LAST_YEAR = 2024
+# Text properties vectorized by text2vec_cohere and indexed for BM25
+TEXT_PROPERTIES = ["title", "overview", "tagline", "genres"]
+
+
+class SearchBackend(abc.ABC):
+    """Hybrid search over the MovieDemo schema, filtered by a release_year range.
+
+    `alpha` blends the two rankings like Weaviate: 0 is pure keyword (BM25),
+    1 is pure vector search. `search` returns the requested properties of the
+    top `limit` movies, best first. A year_range of None means no filter.
+    Backends implement `scored_search` and `scored_candidates`.
+    """
+
+    name = "backend"
+
+    @abc.abstractmethod
+    def scored_search(self, query, year_range, alpha, limit, return_properties):
+        """Like search, but returns (score, properties) pairs"""
+
+    def search(self, query, year_range, alpha, limit, return_properties):
+        return [props for _, props in self.scored_search(query, year_range, alpha, limit, return_properties)]
+
+    async def ascored_search(self, query, year_range, alpha, limit, return_properties):
+        """Async scored_search; backends without a native async client run it in a worker thread"""
+        return await asyncio.to_thread(self.scored_search, query, year_range, alpha, limit, return_properties)
+
+    async def asearch(self, query, year_range, alpha, limit, return_properties):
+        return [props for _, props in await self.ascored_search(query, year_range, alpha, limit, return_properties)]
+
+    @abc.abstractmethod
+    def scored_candidates(self, query, year_range, alpha, k, return_properties):
+        """Raw BM25 and vector scores of the top k movies of each ranking, before fusion.
+
+        Returns (keyword, vector) lists of (score, properties), best first, where
+        properties always include movie_id. A ranking with no weight at this
+        alpha is left empty. PartitionedBackend fuses these over
+        all partitions, since fused scores are only comparable within one search.
+        """
+
+    async def ascored_candidates(self, query, year_range, alpha, k, return_properties):
+        return await asyncio.to_thread(self.scored_candidates, query, year_range, alpha, k, return_properties)
+
+
+def _year_filter(year_range):
+    if year_range is None:
+        return None
+    return (
+        Filter.by_property("release_year").greater_or_equal(year_range[0]) &
+        Filter.by_property("release_year").less_or_equal(year_range[1])
+    )
+
+
+def _with_movie_id(return_properties):
+    return list(dict.fromkeys([*return_properties, "movie_id"]))
+
+
+def _keyword_hits(response):
+    return [(obj.metadata.score, obj.properties) for obj in response.objects]
+
+
+def _vector_hits(response):
+    # cosine distance, so that higher is better like the BM25 scores
+    return [(1 - obj.metadata.distance, obj.properties) for obj in response.objects]
+
+
+class WeaviateBackend(SearchBackend):
+    """Search a Weaviate collection, or one tenant of it, through a (sync) Weaviate client"""
+
+    name = "Weaviate"
+
+    def __init__(self, client, collection_name=COLLECTION_NAME, tenant=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.tenant = tenant
+
+    def for_tenant(self, tenant):
+        return WeaviateBackend(self.client, self.collection_name, tenant)
+
+    def _collection(self):
+        collection = self.client.collections.get(self.collection_name)
+        if self.tenant is not None:
+            collection = collection.with_tenant(self.tenant)
+        return collection
+
+    def scored_search(self, query, year_range, alpha, limit, return_properties):
+        response = self._collection().query.hybrid(
+            query=query,
+            filters=_year_filter(year_range),
+            limit=limit,
+            alpha=alpha,
+            return_properties=return_properties,
+            return_metadata=MetadataQuery(score=True),
+        )
+        return [(obj.metadata.score, obj.properties) for obj in response.objects]
+
+    def scored_candidates(self, query, year_range, alpha, k, return_properties):
+        collection = self._collection()
+        properties = _with_movie_id(return_properties)
+        keyword, vector = [], []
+        if alpha < 1:
+            keyword = _keyword_hits(collection.query.bm25(
+                query=query,
+                filters=_year_filter(year_range),
+                limit=k,
+                return_properties=properties,
+                return_metadata=MetadataQuery(score=True),
+            ))
+        if alpha > 0:
+            vector = _vector_hits(collection.query.near_text(
+                query=query,
+                filters=_year_filter(year_range),
+                limit=k,
+                return_properties=properties,
+                return_metadata=MetadataQuery(distance=True),
+            ))
+        return keyword, vector
+
+
+class AsyncWeaviateBackend(SearchBackend):
+    """Search through one async Weaviate client shared by every session.
+
+    The client and its connection pool live on a background event loop
+    (async_pipeline.BackgroundLoop), so searches from different sessions are
+    multiplexed over the same connections instead of opening a client per call.
+    """
+
+    name = "Weaviate (async)"
+
+    def __init__(self, loop, client, collection_name=COLLECTION_NAME, tenant=None):
+        self.loop = loop
+        self.client = client
+        self.collection_name = collection_name
+        self.tenant = tenant
+
+    @classmethod
+    def connect(cls, loop, url, api_key, headers=None, pool_size=20, collection_name=COLLECTION_NAME):
+        """Connect to Weaviate Cloud on the loop, keeping up to pool_size connections open"""
+        client = weaviate.use_async_with_weaviate_cloud(
+            cluster_url=url,
+            auth_credentials=Auth.api_key(api_key),
+            headers=headers,
+            additional_config=AdditionalConfig(
+                connection=ConnectionConfig(session_pool_connections=pool_size, session_pool_maxsize=pool_size)
+            ),
+        )
+        loop.run(client.connect())
+        return cls(loop, client, collection_name)
+
+    def for_tenant(self, tenant):
+        return AsyncWeaviateBackend(self.loop, self.client, self.collection_name, tenant)
+
+    async def ascored_search(self, query, year_range, alpha, limit, return_properties):
+        collection = self.client.collections.get(self.collection_name)
+        if self.tenant is not None:
+            collection = collection.with_tenant(self.tenant)
+        response = await collection.query.hybrid(
+            query=query,
+            filters=_year_filter(year_range),
+            limit=limit,
+            alpha=alpha,
+            return_properties=return_properties,
+            return_metadata=MetadataQuery(score=True),
+        )
+        return [(obj.metadata.score, obj.properties) for obj in response.objects]
+
+    def scored_search(self, query, year_range, alpha, limit, return_properties):
+        return self.loop.run(self.ascored_search(query, year_range, alpha, limit, return_properties))
+
+    async def ascored_candidates(self, query, year_range, alpha, k, return_properties):
+        collection = self.client.collections.get(self.collection_name)
+        if self.tenant is not None:
+            collection = collection.with_tenant(self.tenant)
+        properties = _with_movie_id(return_properties)
+
+        async def _keyword():
+            if alpha == 1:
+                return []
+            return _keyword_hits(await collection.query.bm25(
+                query=query,
+                filters=_year_filter(year_range),
+                limit=k,
+                return_properties=properties,
+                return_metadata=MetadataQuery(score=True),
+            ))
+
+        async def _vector():
+            if alpha == 0:
+                return []
+            return _vector_hits(await collection.query.near_text(
+                query=query,
+                filters=_year_filter(year_range),
+                limit=k,
+                return_properties=properties,
+                return_metadata=MetadataQuery(distance=True),
+            ))
+
+        return tuple(await asyncio.gather(_keyword(), _vector()))
+
+    def scored_candidates(self, query, year_range, alpha, k, return_properties):
+        return self.loop.run(self.ascored_candidates(query, year_range, alpha, k, return_properties))
+
+    def close(self):
+        self.loop.run(self.client.close())
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def document_text(props):
+    """Concatenate the text properties of a movie, as the vectorizer and BM25 see it"""
+    parts = []
+    for name in TEXT_PROPERTIES:
+        value = props.get(name)
+        if isinstance(value, list):
+            parts.extend(str(v) for v in value)
+        elif value:
+            parts.append(str(value))
+    return " ".join(parts)
+
+
+def hash_embedding(text, dim=256):
+    """Deterministic local embedding: signed feature hashing of words and word bigrams.
+
+    Not semantic like Cohere embeddings, but stable across processes and runs,
+    which is what latency and recall benchmarks need.
+    """
+    tokens = tokenize(text)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def corpus_statistics(documents):
+    """(number of documents, average length, document frequency of each term) for BM25"""
+    doc_freqs = Counter()
+    total_length = 0
+    for text in documents:
+        tokens = tokenize(text)
+        total_length += len(tokens)
+        doc_freqs.update(set(tokens))
+    return len(documents), total_length / len(documents) if documents else 0.0, doc_freqs
+
+
+class BM25Index:
+    """In-memory BM25 inverted index with Weaviate's default k1 and b.
+
+    An index over part of a corpus can be given the corpus_statistics of the
+    whole, so that its scores match those of a single index over the corpus.
+    """
+
+    def __init__(self, documents, k1=1.2, b=0.75, corpus=None):
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(documents)
+        postings = defaultdict(lambda: ([], []))
+        lengths = np.zeros(self.num_docs, dtype=np.float32)
+        for doc_id, text in enumerate(documents):
+            counts = Counter(tokenize(text))
+            lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term][0].append(doc_id)
+                postings[term][1].append(tf)
+        self.doc_lengths = lengths
+        self.postings = {
+            term: (np.array(ids, dtype=np.int32), np.array(tfs, dtype=np.float32))
+            for term, (ids, tfs) in postings.items()
+        }
+        if corpus is None:
+            self.corpus_docs = self.num_docs
+            self.avg_length = float(lengths.mean()) if self.num_docs else 0.0
+            self.doc_freqs = None
+        else:
+            self.corpus_docs, self.avg_length, self.doc_freqs = corpus
+
+    def scores(self, query):
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            ids, tfs = self.postings[term]
+            doc_freq = len(ids) if self.doc_freqs is None else self.doc_freqs[term]
+            idf = math.log(1 + (self.corpus_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[ids] / self.avg_length)
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        return scores
+
+
+def _top_candidates(scores, mask, k):
+    """Indices of the k best-scoring documents allowed by mask, best first"""
+    candidates = np.flatnonzero(mask)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _normalized(scores, candidates):
+    """Min-max normalize the candidates' scores to [0, 1], like relativeScoreFusion"""
+    values = scores[candidates]
+    if not len(values):
+        return values
+    spread = values.max() - values.min()
+    return (values - values.min()) / spread if spread else np.ones_like(values)
+
+
+def fuse(keyword, vector, alpha, limit):
+    """Relative score fusion of two rankings of (key, raw score) pairs, like Weaviate's hybrid search.
+
+    Scores are min-max normalized within each ranking and blended with alpha.
+    Returns the top limit (key, fused score) pairs, best first.
+    """
+    fused = defaultdict(float)
+    for weight, ranking in ((1 - alpha, keyword), (alpha, vector)):
+        if not ranking:
+            continue
+        keys = [key for key, _ in ranking]
+        scores = np.array([score for _, score in ranking], dtype=np.float32)
+        for key, score in zip(keys, _normalized(scores, np.arange(len(scores)))):
+            fused[key] += weight * score
+    ranked = sorted(fused.items(), key=lambda item: (-item[1], item[0]))
+    return [(key, float(score)) for key, score in ranked[:limit]]
+
+
+def load_movies(json_file_path):
+    """MovieDemo property dicts for every valid movie in the file"""
+    movies = []
+    for _, chunk in iter_chunks(iter_movie_records(json_file_path), 1000):
+        valid, _ = build_properties(chunk)
+        movies.extend(props for _, props in valid)
+    return movies
+
+
+# Number of set bits in every byte value, for Hamming distances over packed bits
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class LocalBackend(SearchBackend):
+    """In-process backend: flat NumPy vector index plus BM25, fused like Weaviate's hybrid search.
+
+    With bq=True vectors are binary quantized (one sign bit per dimension):
+    candidates are found by Hamming distance and the best rescore_limit of them
+    are rescored with the full vectors, mirroring the BQ-quantized Weaviate index.
+    `corpus` is passed on to BM25Index.
+    """
+
+    name = "local index"
+
+    def __init__(self, movies, dim=256, fusion_limit=100, bq=False, rescore_limit=200, corpus=None):
+        self.movies = movies
+        self.dim = dim
+        self.fusion_limit = fusion_limit
+        self.bq = bq
+        self.rescore_limit = rescore_limit
+        documents = [document_text(movie) for movie in movies]
+        self.vectors = np.stack([hash_embedding(text, dim) for text in documents]) if movies else np.zeros((0, dim), dtype=np.float32)
+        self.codes = np.packbits(self.vectors > 0, axis=1)
+        self.years = np.array([movie["release_year"] for movie in movies], dtype=np.int32)
+        self.bm25 = BM25Index(documents, corpus=corpus)
+
+    @classmethod
+    def from_movies_json(cls, json_file_path, **kwargs):
+        """Build the index from the same movie file that add_data.py loads into Weaviate"""
+        return cls(load_movies(json_file_path), **kwargs)
+
+    def vector_scores(self, query, mask):
+        """Cosine scores of the documents allowed by mask, and the mask of documents scored"""
+        vector = hash_embedding(query, self.dim)
+        if not self.bq:
+            return self.vectors @ vector, mask
+
+        code = np.packbits(vector > 0)
+        distances = POPCOUNT[np.bitwise_xor(self.codes, code)].sum(axis=1, dtype=np.int32)
+        candidates = _top_candidates(-distances.astype(np.float32), mask, self.rescore_limit)
+        scores = np.zeros(len(self.movies), dtype=np.float32)
+        scores[candidates] = self.vectors[candidates] @ vector
+        rescored = np.zeros(len(self.movies), dtype=bool)
+        rescored[candidates] = True
+        return scores, rescored
+
+    def candidates(self, query, year_range, alpha, k):
+        """(keyword, vector) rankings of the top k movies, as (index, raw score) pairs best first"""
+        if year_range is None:
+            mask = np.ones(len(self.movies), dtype=bool)
+        else:
+            mask = (self.years >= year_range[0]) & (self.years <= year_range[1])
+        keyword, vector = [], []
+        if alpha < 1:
+            keyword_scores = self.bm25.scores(query)
+            candidates = _top_candidates(keyword_scores, mask & (keyword_scores > 0), k)
+            keyword = [(int(doc_id), float(keyword_scores[doc_id])) for doc_id in candidates]
+        if alpha > 0:
+            vector_scores, vector_mask = self.vector_scores(query, mask)
+            candidates = _top_candidates(vector_scores, vector_mask, k)
+            vector = [(int(doc_id), float(vector_scores[doc_id])) for doc_id in candidates]
+        return keyword, vector
+
+    def rank(self, query, year_range, alpha, limit):
+        """(index, fused score) of the top movies for the query, best first"""
+        keyword, vector = self.candidates(query, year_range, alpha, max(limit, self.fusion_limit))
+        return fuse(keyword, vector, alpha, limit)
+
+    def _properties(self, doc_id, return_properties):
+        return {name: self.movies[doc_id].get(name) for name in return_properties}
+
+    def scored_search(self, query, year_range, alpha, limit, return_properties):
+        return [
+            (score, self._properties(doc_id, return_properties))
+            for doc_id, score in self.rank(query, year_range, alpha, limit)
+        ]
+
+    def scored_candidates(self, query, year_range, alpha, k, return_properties):
+        properties = _with_movie_id(return_properties)
+        return tuple(
+            [(score, self._properties(doc_id, properties)) for doc_id, score in ranking]
+            for ranking in self.candidates(query, year_range, alpha, k)
+        )
+
+
+def route_year_range(year_range, decades):
+    """Map a year range onto the decade partitions it overlaps.
+
+    Returns (decade, sub_range) pairs; sub_range is None when the range covers
+    the whole decade, so that partition can be searched without a filter.
+    """
+    routes = []
+    for decade in decades:
+        start, end = max(year_range[0], decade), min(year_range[1], decade + 9)
+        if start > end:
+            continue
+        covered = start == decade and end == decade + 9
+        routes.append((decade, None if covered else (start, end)))
+    return routes
+
+
+class PartitionedBackend(SearchBackend):
+    """Route a year range to decade partitions and merge their results.
+
+    Narrow ranges then search one or two small partitions instead of running a
+    heavily filtered traversal of the whole index. Fused hybrid scores are
+    normalized per search, so each partition's best hit would score about 1.0.
+    Instead the raw BM25 and vector rankings of all partitions are merged and
+    fused once, like a single-index search. BM25 statistics remain per
+    partition, as they are per tenant in Weaviate.
+    """
+
+    def __init__(self, partitions, max_workers=None, fusion_limit=100):
+        self.partitions = dict(sorted(partitions.items()))
+        self.fusion_limit = fusion_limit
+        first = next(iter(self.partitions.values()), None)
+        self.name = f"{first.name if first else 'empty'} by decade"
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max(len(self.partitions), 1))
+
+    @classmethod
+    def local(cls, movies, **kwargs):
+        """One LocalBackend per decade, scoring BM25 with the statistics of all movies"""
+        by_decade = defaultdict(list)
+        for movie in movies:
+            by_decade[decade_of(movie["release_year"])].append(movie)
+        corpus = corpus_statistics([document_text(movie) for movie in movies])
+        return cls({
+            decade: LocalBackend(decade_movies, corpus=corpus, **kwargs)
+            for decade, decade_movies in by_decade.items()
+        })
+
+    @classmethod
+    def tenants(cls, backend, first_year=FIRST_YEAR, last_year=LAST_YEAR):
+        """One tenant per decade of the collection searched by a (sync or async) Weaviate backend"""
+        decades = range(decade_of(first_year), decade_of(last_year) + 1, 10)
+        return cls({decade: backend.for_tenant(decade_tenant(decade)) for decade in decades})
+
+    @classmethod
+    def weaviate(cls, client, collection_name=PARTITIONED_COLLECTION_NAME, first_year=FIRST_YEAR, last_year=LAST_YEAR):
+        """One tenant of the partitioned collection per decade"""
+        return cls.tenants(WeaviateBackend(client, collection_name), first_year, last_year)
+
+    def routes(self, year_range):
+        if year_range is None:
+            return [(decade, None) for decade in self.partitions]
+        return route_year_range(year_range, self.partitions)
+
+    @staticmethod
+    def merge_candidates(results, k):
+        """Merge the partitions' (keyword, vector) candidates into the top k of each ranking"""
+        return tuple(
+            sorted((hit for candidates in results for hit in candidates[side]), key=lambda hit: -hit[0])[:k]
+            for side in range(2)
+        )
+
+    @classmethod
+    def merge(cls, results, alpha, k, limit, return_properties):
+        """Fuse the partitions' (keyword, vector) candidates into one top limit"""
+        properties = {}
+        rankings = []
+        for merged in cls.merge_candidates(results, k):
+            for _, props in merged:
+                properties[props["movie_id"]] = props
+            rankings.append([(props["movie_id"], score) for score, props in merged])
+        return [
+            (score, {name: properties[movie_id].get(name) for name in return_properties})
+            for movie_id, score in fuse(*rankings, alpha, limit)
+        ]
+
+    def _partition_candidates(self, query, year_range, alpha, k, return_properties):
+        futures = [
+            self._executor.submit(
+                self.partitions[decade].scored_candidates, query, sub_range, alpha, k, return_properties
+            )
+            for decade, sub_range in self.routes(year_range)
+        ]
+        return [future.result() for future in futures]
+
+    async def _apartition_candidates(self, query, year_range, alpha, k, return_properties):
+        return await asyncio.gather(*[
+            self.partitions[decade].ascored_candidates(query, sub_range, alpha, k, return_properties)
+            for decade, sub_range in self.routes(year_range)
+        ])
+
+    def scored_search(self, query, year_range, alpha, limit, return_properties):
+        k = max(limit, self.fusion_limit)
+        results = self._partition_candidates(query, year_range, alpha, k, return_properties)
+        return self.merge(results, alpha, k, limit, return_properties)
+
+    async def ascored_search(self, query, year_range, alpha, limit, return_properties):
+        k = max(limit, self.fusion_limit)
+        results = await self._apartition_candidates(query, year_range, alpha, k, return_properties)
+        return self.merge(results, alpha, k, limit, return_properties)
+
+    def scored_candidates(self, query, year_range, alpha, k, return_properties):
+        results = self._partition_candidates(query, year_range, alpha, k, return_properties)
+        return self.merge_candidates(results, k)
+
+    async def ascored_candidates(self, query, year_range, alpha, k, return_properties):
+        results = await self._apartition_candidates(query, year_range, alpha, k, return_properties)
+        return self.merge_candidates(results, k)
@@ -2,14 +2,43 @@ import streamlit as st
 import time
 import sys
 import os
-import base64
-from st_weaviate_connection import WeaviateConnection, WeaviateFilter
-from weaviate.classes.query import Filter
+
+from async_pipeline import BackgroundLoop, SearchRun
+from backends import (
+    COLLECTION_NAME,
+    PARTITIONED_COLLECTION_NAME,
+    AsyncWeaviateBackend,
+    LocalBackend,
+    PartitionedBackend,
+    load_movies,
+)
+from generation import astream_cohere, astream_local, build_grouped_prompt, local_recommendation
+from poster_store import PosterLRU
+from search_cache import MISSING, TTLCache, generation_key, search_key
 
 # Constants
 ENV_VARS = ["WEAVIATE_URL", "WEAVIATE_API_KEY", "COHERE_API_KEY"]
+# "weaviate" (Weaviate Cloud + Cohere) or "local" (in-process index, no API keys needed)
+BACKEND = os.environ.get("MOVIE_MAGIC_BACKEND", "weaviate")
+LOCAL_MOVIES_PATH = os.environ.get(
+    "MOVIE_MAGIC_DATA", os.path.join(os.path.dirname(__file__), "helpers/data/1950_2024_movies_info.json")
+)
+# Set MOVIE_MAGIC_PARTITIONS=decade to search one partition per decade: the MovieDemoByDecade
+# collection loaded with `python3 helpers/add_data.py --partition`, or per-decade local indexes
+PARTITION_BY_DECADE = os.environ.get("MOVIE_MAGIC_PARTITIONS", "") == "decade"
 NUM_RECOMMENDATIONS_PER_ROW = 5
 SEARCH_LIMIT = 10
+# Set to True if the collection was loaded with `python3 helpers/add_data.py --posters`
+SHOW_POSTERS = False
+POSTER_CACHE_BYTES = 32 * 1024 * 1024
+# Connections kept open by the async Weaviate client shared by all sessions
+WEAVIATE_POOL_SIZE = 20
+# Retrieval results go stale faster than the recommendations generated from them
+SEARCH_CACHE_TTL = 10 * 60
+GENERATION_CACHE_TTL = 60 * 60
+SEARCH_CACHE_SIZE = 256
+# Number of most recent search turns rendered on every rerun; older ones are collapsed
+HISTORY_TURNS = 3
 
 # Search Mode descriptions
 SEARCH_MODES = {
@@ -18,6 +47,16 @@ SEARCH_MODES = {
     "Hybrid": ("Hybrid search combines vector and BM25 searches to offer best-of-both-worlds search results.", 0.7),
 }
 
+# Example (movie type, occasion) prompts, also replayed by helpers/benchmark_search.py
+EXAMPLE_PROMPTS = [
+    ("sci-fi adventure", "movie night with friends"),
+    ("romantic comedy", "date night"),
+    ("animated family film", "family viewing"),
+    ("classic thriller", "solo watching"),
+    ("historical drama", "educational evening"),
+    ("indie comedy-drama", "film club discussion"),
+]
+
 # Functions
 def get_env_vars(env_vars):
     """Retrieve environment variables"""
@@ -28,34 +67,67 @@ def get_env_vars(env_vars):
             sys.exit(f"{var} not set")
     return env_vars
 
+def render_message(message):
+    """Render one chat message; posters are looked up by movie id in the shared poster store"""
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        if "latency" in message:
+            st.caption(f"Latency: {message['latency']}")
+        if "posters" in message:
+            poster_store = get_poster_store()
+            for i in range(0, len(message["posters"]), NUM_RECOMMENDATIONS_PER_ROW):
+                cols = st.columns(NUM_RECOMMENDATIONS_PER_ROW)
+                for j, col in enumerate(cols):
+                    if i + j < len(message["posters"]):
+                        movie_id, title = message["posters"][i + j]
+                        poster = poster_store.get(movie_id)
+                        if poster is not None:
+                            col.image(poster, width=200)
+                        else:
+                            col.write(title)
+        if "titles" in message:
+            for i in range(0, len(message["titles"]), NUM_RECOMMENDATIONS_PER_ROW):
+                cols = st.columns(NUM_RECOMMENDATIONS_PER_ROW)
+                for j, col in enumerate(cols):
+                    if i + j < len(message["titles"]):
+                        col.write(message["titles"][i + j])
+
+@st.fragment
+def display_earlier_messages(count):
+    """Collapsed history; expanding it only reruns this fragment"""
+    if st.toggle(f"Show {count} earlier messages", key="show_earlier_messages"):
+        for message in st.session_state.messages[:count]:
+            render_message(message)
+
 def display_chat_messages():
-    """Print message history"""
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-            if "images" in message:
-                for i in range(0, len(message["images"]), NUM_RECOMMENDATIONS_PER_ROW):
-                    cols = st.columns(NUM_RECOMMENDATIONS_PER_ROW)
-                    for j, col in enumerate(cols):
-                        if i + j < len(message["images"]):
-                            col.image(message["images"][i + j], width=200)
-            if "titles" in message:
-                for i in range(0, len(message["titles"]), NUM_RECOMMENDATIONS_PER_ROW):
-                    cols = st.columns(NUM_RECOMMENDATIONS_PER_ROW)
-                    for j, col in enumerate(cols):
-                        if i + j < len(message["titles"]):
-                            col.write(message["titles"][i + j])
-
-
-def base64_to_image(base64_str):
-    """Convert base64 string to image"""
-    return f"data:image/png;base64,{base64_str}"
+    """Print message history, rendering only the last HISTORY_TURNS turns eagerly"""
+    messages = st.session_state.messages
+    user_indices = [i for i, message in enumerate(messages) if message["role"] == "user"]
+    split = user_indices[-HISTORY_TURNS] if len(user_indices) >= HISTORY_TURNS else 0
+    if split:
+        display_earlier_messages(split)
+    for message in messages[split:]:
+        render_message(message)
+
+
+@st.cache_resource
+def get_poster_store():
+    """Poster thumbnails shared by all sessions, bounded in memory"""
+    return PosterLRU(max_bytes=POSTER_CACHE_BYTES)
+
+@st.cache_resource
+def get_search_caches():
+    """Retrieval and generation caches shared by all sessions"""
+    return {
+        "search": TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL),
+        "generation": TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=GENERATION_CACHE_TTL),
+    }
 
 def clean_input(input_text):
     """Clean user input"""
     return input_text.replace('"', "").replace("'", "")
 
-def setup_sidebar():
+def setup_sidebar(backend):
     """Setup sidebar elements"""
     with st.sidebar:
         st.title("🎥🍿 Movie Magic")
@@ -66,31 +138,66 @@ def setup_sidebar():
         mode = st.radio("Search Mode", options=list(SEARCH_MODES.keys()), index=2)
         year_range = st.slider("Year range", min_value=1950, max_value=2024, value=(1990, 2024))
         st.info(SEARCH_MODES[mode][0])
-        st.success("Connected to Weaviate", icon="💚")
+        st.success(f"Connected to {backend.name}", icon="💚")
+
+        caches = get_search_caches()
+        st.caption(
+            "Cache: "
+            + " · ".join(f"{name} {cache.hits} hits / {cache.misses} misses" for name, cache in caches.items())
+        )
 
     return mode, year_range
 
-def setup_weaviate_connection(env_vars):
-    """Setup Weaviate connection"""
-    return st.connection(
-        "weaviate",
-        type=WeaviateConnection,
-        url=env_vars["WEAVIATE_URL"],
-        api_key=env_vars["WEAVIATE_API_KEY"],
-        additional_headers={"X-Cohere-Api-Key": env_vars["COHERE_API_KEY"]},
+@st.cache_resource
+def get_background_loop():
+    """Event loop thread running every session's searches and generations"""
+    return BackgroundLoop()
+
+@st.cache_resource
+def setup_weaviate_backend(url, api_key, cohere_api_key, partitioned=False):
+    """Async Weaviate client with one connection pool shared by all sessions"""
+    backend = AsyncWeaviateBackend.connect(
+        get_background_loop(),
+        url,
+        api_key,
+        headers={"X-Cohere-Api-Key": cohere_api_key},
+        pool_size=WEAVIATE_POOL_SIZE,
+        collection_name=PARTITIONED_COLLECTION_NAME if partitioned else COLLECTION_NAME,
+    )
+    return PartitionedBackend.tenants(backend) if partitioned else backend
+
+@st.cache_resource
+def setup_local_backend(json_file_path, partitioned=False):
+    """In-process index over the movie file, built once per server"""
+    if partitioned:
+        return PartitionedBackend.local(load_movies(json_file_path))
+    return LocalBackend.from_movies_json(json_file_path)
+
+def setup_backend(env_vars):
+    """Search backend selected with the MOVIE_MAGIC_BACKEND and MOVIE_MAGIC_PARTITIONS environment variables"""
+    if BACKEND == "local":
+        return setup_local_backend(LOCAL_MOVIES_PATH, PARTITION_BY_DECADE)
+    return setup_weaviate_backend(
+        env_vars["WEAVIATE_URL"], env_vars["WEAVIATE_API_KEY"], env_vars["COHERE_API_KEY"], PARTITION_BY_DECADE
     )
 
+@st.cache_resource
+def setup_cohere_client(api_key):
+    """Async Cohere client used on the background loop to stream recommendations"""
+    # only needed with a Cohere API key, the local backend runs without it
+    import cohere
+
+    return cohere.AsyncClientV2(api_key=api_key)
+
+def setup_generator(env_vars):
+    """Return a function giving an async token stream of a recommendation over the retrieved movies"""
+    if not env_vars.get("COHERE_API_KEY"):
+        return lambda task, movies: astream_local(local_recommendation(task, movies))
+    client = setup_cohere_client(env_vars["COHERE_API_KEY"])
+    return lambda task, movies: astream_cohere(client, build_grouped_prompt(task, movies))
+
 def display_example_prompts():
     """Display example prompt buttons"""
-    example_prompts = [
-        ("sci-fi adventure", "movie night with friends"),
-        ("romantic comedy", "date night"),
-        ("animated family film", "family viewing"),
-        ("classic thriller", "solo watching"),
-        ("historical drama", "educational evening"),
-        ("indie comedy-drama", "film club discussion"),
-    ]
-
     example_prompts_help = [
         "Search for sci-fi adventure movies suitable for a group viewing",
         "Find romantic comedies perfect for a date night",
@@ -106,7 +213,7 @@ def display_example_prompts():
     button_cols = st.columns(3)
     button_cols_2 = st.columns(3)
 
-    for i, ((movie_type, occasion), help_text) in enumerate(zip(example_prompts, example_prompts_help)):
+    for i, ((movie_type, occasion), help_text) in enumerate(zip(EXAMPLE_PROMPTS, example_prompts_help)):
         col = button_cols[i] if i < 3 else button_cols_2[i-3]
         if col.button(f"{movie_type} for a {occasion}", help=help_text):
             st.session_state.example_movie_type = movie_type
@@ -114,84 +221,101 @@ def display_example_prompts():
             return True
     return False
 
-def perform_search(conn, movie_type, rag_prompt, year_range, mode):
-    """Perform search and display results"""
-    df = conn.query(
-        "MovieDemo",
-        query=movie_type,
-        # Uncomment the line below  if you want to use this with poster images
-        # return_properties=["title", "tagline", "poster"],
-        # Comment out the line below  if you want to use this with poster images
-        return_properties=["title", "tagline"],
-        filters=(
-            WeaviateFilter.by_property("release_year").greater_or_equal(year_range[0]) &
-            WeaviateFilter.by_property("release_year").less_or_equal(year_range[1])
-        ),
-        limit=SEARCH_LIMIT,
-        alpha=SEARCH_MODES[mode][1],
+async def resolved(value):
+    """Coroutine returning an already known value, e.g. a cached retrieval"""
+    return value
+
+def perform_search(backend, generate, movie_type, rag_prompt, year_range, mode):
+    """Perform search and display results.
+
+    Retrieval and generation run on the shared background loop: the results
+    are rendered as soon as retrieval returns while the recommendation is
+    already being generated.
+    """
+    caches = get_search_caches()
+    alpha = SEARCH_MODES[mode][1]
+    timings = {}
+
+    cache_key = search_key(movie_type, year_range, alpha, SEARCH_LIMIT)
+    rag_key = generation_key(movie_type, year_range, alpha, SEARCH_LIMIT, rag_prompt)
+    cached_movies = caches["search"].get(cache_key)
+    if cached_movies is MISSING:
+        retrieve = backend.asearch(
+            movie_type,
+            year_range,
+            alpha,
+            SEARCH_LIMIT,
+            return_properties=["title", "tagline", "movie_id", "poster"] if SHOW_POSTERS else ["title", "tagline"],
+        )
+    else:
+        retrieve = resolved(cached_movies)
+    # The recommendation is generated from exactly the movies shown, without a second search
+    full_response = caches["generation"].get(rag_key)
+    run = SearchRun(
+        get_background_loop(),
+        retrieve,
+        lambda movies: generate(rag_prompt, movies) if full_response is MISSING else None,
     )
 
-    images = []
+    movies = run.movies()
+    if cached_movies is MISSING:
+        timings["search"] = run.search_ms
+        caches["search"].set(cache_key, movies)
+
+    posters = []
     titles = []
-    
-    if df is None or df.empty:
+
+    if not movies:
         with st.chat_message("assistant"):
             st.write(f"No movies found matching {movie_type} and using {mode}. Please try again.")
         st.session_state.messages.append({"role": "assistant", "content": "No movies found. Please try again."})
         return
-    else:
-        with st.chat_message("assistant"):
-            st.write("Raw search results.")
-            cols = st.columns(NUM_RECOMMENDATIONS_PER_ROW)
-            for index, row in df.iterrows():
-                col = cols[index % NUM_RECOMMENDATIONS_PER_ROW]
-                if "poster" in row and row["poster"]:
-                    col.image(base64_to_image(row["poster"]), width=200)
-                    images.append(base64_to_image(row["poster"]))
-                else:
-                    col.write(f"{row['title']}")
-                    titles.append(row["title"])
-            
-            st.write("Now generating recommendation from these: ...")
-
-        st.session_state.messages.append(
-            {"role": "assistant", "content": "Raw search results. Generating recommendation from these: ...", "images": images, "titles": titles})
-        
-        with conn.client() as client:
-            collection = client.collections.get("MovieDemo")
-            response = collection.generate.hybrid(
-                query=movie_type,
-                filters=(
-                    Filter.by_property("release_year").greater_or_equal(year_range[0]) &
-                    Filter.by_property("release_year").less_or_equal(year_range[1])
-                ),
-                limit=SEARCH_LIMIT,
-                alpha=SEARCH_MODES[mode][1],
-                grouped_task=rag_prompt,
-                grouped_properties=["title", "tagline"],
-            )
-
-            rag_response = response.generated
-
-            with st.chat_message("assistant"):
-                message_placeholder = st.empty()
-                full_response = ""
-                for chunk in rag_response.split():
-                    full_response += chunk + " "
-                    time.sleep(0.02)
-                    message_placeholder.markdown(full_response + "▌")
-                message_placeholder.markdown(full_response)
-
-        st.session_state.messages.append(
-            {"role": "assistant", "content": "Recommendation from these search results: " + full_response}
-        )
+
+    start = time.perf_counter()
+    with st.chat_message("assistant"):
+        st.write("Raw search results.")
+        cols = st.columns(NUM_RECOMMENDATIONS_PER_ROW)
+        poster_store = get_poster_store()
+        for index, movie in enumerate(movies):
+            col = cols[index % NUM_RECOMMENDATIONS_PER_ROW]
+            if movie.get("poster"):
+                col.image(poster_store.put(movie["movie_id"], movie["poster"]), width=200)
+                posters.append((movie["movie_id"], movie["title"]))
+            else:
+                col.write(f"{movie['title']}")
+                titles.append(movie["title"])
+    timings["render"] = (time.perf_counter() - start) * 1000
+
+    st.session_state.messages.append(
+        {"role": "assistant", "content": "Raw search results. Recommendation from these:", "posters": posters, "titles": titles})
+
+    with st.chat_message("assistant"):
+        if full_response is not MISSING:
+            st.markdown(full_response)
+        else:
+            full_response = st.write_stream(run.tokens())
+            timings["first token"] = run.first_token_ms
+            timings["generation"] = run.generation_ms
+            caches["generation"].set(rag_key, full_response)
+        latency = " · ".join(f"{name} {ms:.0f} ms" for name, ms in timings.items() if ms is not None)
+        if "search" not in timings:
+            latency = f"cached search · {latency}"
+        st.caption(f"Latency: {latency}")
+
+    st.session_state.messages.append(
+        {"role": "assistant", "content": "Recommendation from these search results: " + full_response, "latency": latency}
+    )
 
 def main():
     st.title("🎥🍿 Movie Magic")
 
-    env_vars = get_env_vars(ENV_VARS)
-    conn = setup_weaviate_connection(env_vars)
-    mode, year_range = setup_sidebar()
+    if BACKEND == "local":
+        env_vars = {var: os.environ.get(var, "") for var in ENV_VARS}
+    else:
+        env_vars = get_env_vars(ENV_VARS)
+    backend = setup_backend(env_vars)
+    generate = setup_generator(env_vars)
+    mode, year_range = setup_sidebar(backend)
 
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -232,7 +356,7 @@ def main():
             st.markdown(prompt)
         st.session_state.messages.append({"role": "user", "content": prompt})
 
-        perform_search(conn, movie_type, rag_prompt, year_range, mode)
+        perform_search(backend, generate, movie_type, rag_prompt, year_range, mode)
         st.rerun()
 
     if example_selected:
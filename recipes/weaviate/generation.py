@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+COHERE_MODEL = "command-r-plus"
+
+
+def build_grouped_prompt(task, movies, properties=("title", "tagline")):
+    """Prompt for a grouped task over the retrieved movies, like Weaviate's grouped_task"""
+    items = [{name: movie.get(name) for name in properties} for movie in movies]
+    return f"{task}\n\n{json.dumps(items, ensure_ascii=False)}"
+
+
+def stream_cohere(client, prompt, model=COHERE_MODEL):
+    """Yield the recommendation text from Cohere as it is generated"""
+    for event in client.chat_stream(model=model, messages=[{"role": "user", "content": prompt}]):
+        if event.type == "content-delta":
+            yield event.delta.message.content.text
+
+
+def stream_local(text):
+    """Local stand-in for a generative backend: yields a fixed answer word by word"""
+    words = text.split(" ")
+    for i, word in enumerate(words):
+        yield word if i == len(words) - 1 else word + " "
+
+
+async def astream_cohere(client, prompt, model=COHERE_MODEL):
+    """Async stream_cohere for cohere.AsyncClientV2, run on the shared background loop"""
+    async for event in client.chat_stream(model=model, messages=[{"role": "user", "content": prompt}]):
+        if event.type == "content-delta":
+            yield event.delta.message.content.text
+
+
+async def astream_local(text, delay=0.0):
+    """Async stream_local; delay seconds between words simulates a generative backend's pace"""
+    for token in stream_local(text):
+        if delay:
+            await asyncio.sleep(delay)
+        yield token
+
+
+def local_recommendation(task, movies):
+    """Deterministic recommendation used when no generative model is configured"""
+    picks = [f"**{movie['title']}**" + (f" ({movie['tagline']})" if movie.get("tagline") else "") for movie in movies[:2]]
+    return f"Offline pick from the results: {' and '.join(picks)}. Enjoy the show!"
+
@@ -1,144 +1,369 @@
+import argparse
 import pandas as pd
 from pathlib import Path
 import weaviate
 from weaviate.classes.config import Configure, DataType, Property
 from weaviate.classes.query import Filter
+from weaviate.classes.tenants import Tenant
 from weaviate.util import generate_uuid5
 from datetime import datetime, timezone
 import toml
 import os
 from weaviate.classes.init import Auth
 from tqdm import tqdm
-import base64
+
+from concurrent_ingest import concurrent_ingest
+from delta_sync import delta_sync, discard_manifest
+from movie_stream import (
+    build_properties, decade_of, decade_tenant, discard_checkpoint, iter_chunks, iter_movie_records, stream_ingest,
+    to_data_objects,
+)
+from posters import PosterEncoder
 
 # Construct the path to the toml file
 current_dir = os.path.dirname(__file__)
 parent_dir = os.path.dirname(current_dir)
 toml_file_path = os.path.join(parent_dir, ".streamlit/secrets.toml")
 
-config = toml.load(toml_file_path)
+# Data files used by the loaders
+data_dir = os.path.join(current_dir, "data")
+json_file_path = os.path.join(data_dir, "1950_2024_movies_info.json")
+rejects_file_path = os.path.join(data_dir, "rejects.ndjson")
+img_dir = Path(os.path.join(data_dir, "posters"))
+poster_cache_dir = os.path.join(data_dir, "poster_cache")
 
-# Access values from the toml file
-weaviate_api_key = config["WEAVIATE_API_KEY"]
-weaviate_url = config["WEAVIATE_URL"]
-cohere_api_key = config["COHERE_API_KEY"]
+COLLECTION_NAME = "MovieDemo"
+# Must match backends.PARTITIONED_COLLECTION_NAME, which the app searches by decade
+PARTITIONED_COLLECTION_NAME = "MovieDemoByDecade"
 
-# Client for Weaviate Cloud
-client = weaviate.connect_to_weaviate_cloud(
-    cluster_url=weaviate_url,
-    auth_credentials=Auth.api_key(weaviate_api_key),
-    headers={
-        "X-Cohere-Api-Key": cohere_api_key
-    }
-)
 
-# If you are using a local instance of Weaviate, you can use the following code
-# client = weaviate.connect_to_local(headers={"X-Cohere-Api-Key": cohere_apikey})
+def manifest_file_path(name):
+    """Content hashes of the last --sync of a collection, one file per collection"""
+    return os.path.join(data_dir, f"sync_manifest.{name}.json")
 
-# Delete any existing MovieDemo Collection to prevent errors
-client.collections.delete(["MovieDemo"])
 
-# Create the MovieDemo Collection
-movies = client.collections.create(
-    name="MovieDemo",
-    properties=[
-        Property(
-            name="title",
-            data_type=DataType.TEXT,
-        ),
-        Property(
-            name="overview",
-            data_type=DataType.TEXT,
-        ),
-        Property(
-            name="tagline",
-            data_type=DataType.TEXT,
-        ),
-        Property(
-            name="movie_id",
-            data_type=DataType.INT,
-            skip_vectorization=True,
-        ),
-        Property(
-            name="release_year",
-            data_type=DataType.INT,
-        ),
-        Property(
-            name="genres",
-            data_type=DataType.TEXT_ARRAY,
-        ),
-        Property(
-            name="vote_average",
-            data_type=DataType.NUMBER,
-        ),
-        Property(
-            name="vote_count",
-            data_type=DataType.INT,
-        ),
-        Property(
-            name="revenue",
-            data_type=DataType.INT,
-        ),
-        Property(
-            name="budget",
-            data_type=DataType.INT,
+def checkpoint_file_path(name):
+    """Offset of the last committed record of a --stream load, one file per collection"""
+    return os.path.join(data_dir, f"ingest_checkpoint.{name}.json")
+
+
+def discard_load_state(name):
+    """Forget the previous loads into a collection that was just created or recreated"""
+    discard_manifest(manifest_file_path(name))
+    discard_checkpoint(checkpoint_file_path(name))
+
+
+def connect():
+    """Connect to Weaviate Cloud using the app secrets"""
+    config = toml.load(toml_file_path)
+
+    # Access values from the toml file
+    weaviate_api_key = config["WEAVIATE_API_KEY"]
+    weaviate_url = config["WEAVIATE_URL"]
+    cohere_api_key = config["COHERE_API_KEY"]
+
+    # If you are using a local instance of Weaviate, you can use the following code instead
+    # return weaviate.connect_to_local(headers={"X-Cohere-Api-Key": cohere_api_key})
+
+    # Client for Weaviate Cloud
+    return weaviate.connect_to_weaviate_cloud(
+        cluster_url=weaviate_url,
+        auth_credentials=Auth.api_key(weaviate_api_key),
+        headers={
+            "X-Cohere-Api-Key": cohere_api_key
+        }
+    )
+
+
+def create_collection(client, name=COLLECTION_NAME, posters=False, bq=True, partitioned=False):
+    """Create the MovieDemo Collection, with a poster thumbnail blob if requested.
+
+    A partitioned collection is multi-tenant: each decade is loaded into its own tenant.
+    """
+    poster_properties = [Property(name="poster", data_type=DataType.BLOB)] if posters else []
+    return client.collections.create(
+        name=name,
+        properties=[
+            Property(
+                name="title",
+                data_type=DataType.TEXT,
+            ),
+            Property(
+                name="overview",
+                data_type=DataType.TEXT,
+            ),
+            Property(
+                name="tagline",
+                data_type=DataType.TEXT,
+            ),
+            Property(
+                name="movie_id",
+                data_type=DataType.INT,
+                skip_vectorization=True,
+            ),
+            Property(
+                name="release_year",
+                data_type=DataType.INT,
+            ),
+            Property(
+                name="genres",
+                data_type=DataType.TEXT_ARRAY,
+            ),
+            Property(
+                name="vote_average",
+                data_type=DataType.NUMBER,
+            ),
+            Property(
+                name="vote_count",
+                data_type=DataType.INT,
+            ),
+            Property(
+                name="revenue",
+                data_type=DataType.INT,
+            ),
+            Property(
+                name="budget",
+                data_type=DataType.INT,
+            ),
+            *poster_properties,
+        ],
+        vectorizer_config=Configure.Vectorizer.text2vec_cohere(),
+        vector_index_config=Configure.VectorIndex.hnsw(
+            quantizer=Configure.VectorIndex.Quantizer.bq() if bq else None
         ),
-        # Uncomment the lines below if you want to use this with poster images
-        # Property(
-        #     name="poster",
-        #     data_type=DataType.BLOB
-        # ),
-    ],
-    vectorizer_config=Configure.Vectorizer.text2vec_cohere(),
-    vector_index_config=Configure.VectorIndex.hnsw(
-        quantizer=Configure.VectorIndex.Quantizer.bq()
-    ),
-    generative_config=Configure.Generative.cohere(model="command-r-plus"),
-)
+        generative_config=Configure.Generative.cohere(model="command-r-plus"),
+        multi_tenancy_config=Configure.multi_tenancy(enabled=True) if partitioned else None,
+    )
+
+
+def load_dataframe(movies, source_path, poster_encoder=None, progress=None):
+    """Add objects to the MovieDemo collection from the JSON file and directory of poster images.
+
+    `progress`, e.g. a tqdm bar, is advanced by one per movie.
+    """
+    movies_df = pd.read_json(source_path)
+    posters = poster_encoder.encode(movies_df["id"].tolist()) if poster_encoder else {}
+
+    with movies.batch.fixed_size(100) as batch:
+        for i, movie_row in movies_df.iterrows():
+            if progress is not None:
+                progress.update(1)
+            try:
+                date_object = datetime.strptime(movie_row["release_date"], "%Y-%m-%d").replace(
+                    tzinfo=timezone.utc
+                )
+                props = {
+                    k: movie_row[k]
+                    for k in [
+                        "title",
+                        "overview",
+                        "tagline",
+                        "vote_count",
+                        "vote_average",
+                        "revenue",
+                        "budget",
+                    ]
+                }
+                props["movie_id"] = movie_row["id"]
+                props["release_year"] = date_object.year
+                props["genres"] = [genre["name"] for genre in movie_row["genres"]]
+                if movie_row["id"] in posters:
+                    props["poster"] = posters[movie_row["id"]]
+
+                batch.add_object(properties=props, uuid=generate_uuid5(movie_row["id"]))
+            except Exception as e:
+                print(f"Error: {e}")
+                movies_df = movies_df.drop(i)
+                movies_df.to_json(source_path, orient="records")
+                continue
+
+
+def recreate_collection(client, name=COLLECTION_NAME, **kwargs):
+    """Delete any existing collection with this name to prevent errors, then create it"""
+    client.collections.delete([name])
+    # The sync hashes and the load checkpoint describe objects that no longer exist
+    discard_load_state(name)
+    return create_collection(client, name, **kwargs)
+
+
+def load_stream(client, source_path, chunk_size, resume, poster_encoder=None, name=COLLECTION_NAME, bq=True):
+    """Stream the JSON file into the collection, resuming from the last checkpoint if asked"""
+    if resume and client.collections.exists(name):
+        movies = client.collections.get(name)
+    else:
+        movies = recreate_collection(client, name, posters=poster_encoder is not None, bq=bq)
+
+    with tqdm(unit="movies") as progress:
+        stats = stream_ingest(
+            movies,
+            source_path,
+            rejects_path=rejects_file_path,
+            checkpoint_path=checkpoint_file_path(name),
+            chunk_size=chunk_size,
+            resume=resume,
+            progress=progress,
+            poster_encoder=poster_encoder,
+        )
+    print(
+        f"Inserted {stats['inserted']} movies starting at offset {stats['start_offset']}, "
+        f"rejected {stats['rejected']} (see {rejects_file_path})"
+    )
+
+
+def load_concurrent(movies, source_path, num_workers):
+    """Shard the dataframe across workers that adapt their batch size to observed latency"""
+    movies_df = pd.read_json(source_path)
+    reports = concurrent_ingest(movies, movies_df, num_workers=num_workers, rejects_path=rejects_file_path)
+    for report in reports:
+        print(
+            f"Shard {report.shard}: {report.inserted} inserted, {report.retried} retried, "
+            f"{report.failed} failed, {report.rejected} rejected, "
+            f"{report.objects_per_sec:.1f} objects/sec "
+            f"(final batch size {report.final_batch_size}, concurrency {report.final_concurrency})"
+        )
+    print(
+        f"Total: {sum(r.inserted for r in reports)} inserted in {max(r.seconds for r in reports):.1f}s, "
+        f"{sum(r.rejected + r.failed for r in reports)} rejected or failed (see {rejects_file_path})"
+    )
+
+
+def load_delta(client, source_path, chunk_size, name=COLLECTION_NAME, bq=True):
+    """Sync the collection in place, re-vectorizing only movies whose content changed"""
+    if client.collections.exists(name):
+        movies = client.collections.get(name)
+    else:
+        discard_load_state(name)
+        movies = create_collection(client, name, bq=bq)
+
+    with tqdm(unit="movies") as progress:
+        report = delta_sync(movies, source_path, manifest_file_path(name), chunk_size=chunk_size, progress=progress)
+    if report.get("manifest_rebuilt"):
+        print(f"No up-to-date sync manifest for {name}, re-upserting every movie")
+    print(
+        f"Skipped {report['skipped']}, inserted {report['inserted']}, updated {report['updated']}, "
+        f"removed {report['removed']}, rejected {report['rejected']}, failed {report['failed']} "
+        f"in {report['seconds']}s"
+    )
+    if "estimated_seconds_saved" in report:
+        print(
+            f"Estimated full reload: {report['estimated_full_reload_seconds']}s "
+            f"(saved ~{report['estimated_seconds_saved']}s)"
+        )
+
+
+def load_partitioned(client, source_path, chunk_size, name=PARTITIONED_COLLECTION_NAME, bq=True):
+    """Load each movie into the tenant of its release decade, creating tenants as they appear"""
+    movies = recreate_collection(client, name, bq=bq, partitioned=True)
+    tenants = set()
+    counts = {}
+    rejected = 0
+
+    with tqdm(unit="movies") as progress:
+        for _, chunk in iter_chunks(iter_movie_records(source_path), chunk_size):
+            valid, bad = build_properties(chunk)
+            rejected += len(bad)
+            by_tenant = {}
+            for item in valid:
+                by_tenant.setdefault(decade_tenant(decade_of(item[1]["release_year"])), []).append(item)
+
+            new_tenants = [Tenant(name=tenant) for tenant in by_tenant if tenant not in tenants]
+            if new_tenants:
+                movies.tenants.create(new_tenants)
+                tenants.update(tenant.name for tenant in new_tenants)
+
+            for tenant, items in by_tenant.items():
+                response = movies.with_tenant(tenant).data.insert_many(to_data_objects(items))
+                for index, error in response.errors.items():
+                    print(f"Error in {tenant}: movie {items[index][1]['movie_id']}: {error.message}")
+                counts[tenant] = counts.get(tenant, 0) + len(items) - len(response.errors)
+            progress.update(len(chunk))
+
+    for tenant in sorted(counts):
+        print(f"{tenant}: {counts[tenant]} movies")
+    print(f"Inserted {sum(counts.values())} movies into {len(counts)} decade tenants, rejected {rejected}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load the movie dataset into the MovieDemo collection.")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse the file incrementally, write bad rows to a rejects file and checkpoint progress.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="With --stream, continue from the last checkpoint instead of recreating the collection.",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Keep the collection and only upsert or delete movies whose vectorized content changed.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Shard the dataframe across this many workers with adaptive batch sizing.",
+    )
+    parser.add_argument(
+        "--posters",
+        action="store_true",
+        help="Store a downscaled poster thumbnail for each movie (default and --stream loaders).",
+    )
+    parser.add_argument("--poster-workers", type=int, default=None)
+    parser.add_argument(
+        "--partition",
+        action="store_true",
+        help=f"Load a multi-tenant collection with one tenant per release decade (default name {PARTITIONED_COLLECTION_NAME}).",
+    )
+    parser.add_argument("--collection", default=None, help=f"Name of the collection to load (default {COLLECTION_NAME}).")
+    parser.add_argument(
+        "--no-bq",
+        dest="bq",
+        action="store_false",
+        help="Create the collection without binary quantization, e.g. as a benchmark reference.",
+    )
+    parser.add_argument("--source", default=json_file_path, help="JSON array or NDJSON file of movies.")
+    parser.add_argument("--chunk-size", type=int, default=100)
+    args = parser.parse_args()
+    if args.collection is None:
+        args.collection = PARTITIONED_COLLECTION_NAME if args.partition else COLLECTION_NAME
+    return args
+
+
+def main():
+    args = parse_args()
+    client = connect()
+    poster_encoder = PosterEncoder(img_dir, poster_cache_dir, workers=args.poster_workers) if args.posters else None
+    try:
+        if args.partition:
+            load_partitioned(client, args.source, args.chunk_size, args.collection, args.bq)
+        elif args.stream:
+            if poster_encoder:
+                with poster_encoder:
+                    load_stream(
+                        client, args.source, args.chunk_size, args.resume, poster_encoder, args.collection, args.bq
+                    )
+            else:
+                load_stream(client, args.source, args.chunk_size, args.resume, name=args.collection, bq=args.bq)
+        elif args.sync:
+            load_delta(client, args.source, args.chunk_size, args.collection, args.bq)
+        elif args.workers:
+            movies = recreate_collection(client, args.collection, bq=args.bq)
+            load_concurrent(movies, args.source, args.workers)
+        else:
+            movies = recreate_collection(client, args.collection, posters=args.posters, bq=args.bq)
+            with tqdm(unit="movies") as progress:
+                if poster_encoder:
+                    with poster_encoder:
+                        load_dataframe(movies, args.source, poster_encoder, progress=progress)
+                else:
+                    load_dataframe(movies, args.source, progress=progress)
+    finally:
+        # Close the connection to Weaviate Cloud
+        client.close()
+
 
-# Add objects to the MovieDemo collection from the JSON file and directory of poster images
-json_file_path = os.path.join(os.getcwd(), "helpers/data/1950_2024_movies_info.json")
-movies_df = pd.read_json(json_file_path)
-
-img_dir = Path(os.path.join(os.getcwd(), "helpers/data/posters"))
-
-dataobj_list = list()
-
-with movies.batch.fixed_size(100) as batch:
-    for i, movie_row in tqdm(movies_df.iterrows()):
-        try:
-            date_object = datetime.strptime(movie_row["release_date"], "%Y-%m-%d").replace(
-                tzinfo=timezone.utc
-            )
-            # Uncomment the lines below if you want to use this with poster images
-            # img_path = (img_dir / f"{movie_row['id']}_poster.jpg")
-            # with open(img_path, "rb") as file:
-            #     poster_b64 = base64.b64encode(file.read()).decode("utf-8")
-
-            props = {
-                k: movie_row[k]
-                for k in [
-                    "title",
-                    "overview",
-                    "tagline",
-                    "vote_count",
-                    "vote_average",
-                    "revenue",
-                    "budget",
-                ]
-            }
-            props["movie_id"] = movie_row["id"]
-            props["release_year"] = date_object.year
-            props["genres"] = [genre["name"] for genre in movie_row["genres"]]
-            # Uncomment the line below if you want to use this with poster images
-            # props["poster"] = poster_b64
-
-            batch.add_object(properties=props, uuid=generate_uuid5(movie_row["id"]))
-        except Exception as e:
-            print(f"Error: {e}")
-            movies_df = movies_df.drop(i)
-            movies_df.to_json(json_file_path, orient="records")
-            continue
-
-# Close the connection to Weaviate Cloud
-client.close()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Throughput benchmark for the movie loaders against a local stub of the batch API.
+
+Compares the original dataframe loader with the streaming loader on a synthetic
+dataset, reporting objects/sec and peak RSS. Each loader runs in its own process
+so that peak RSS is measured independently.
+
+    python3 helpers/benchmark_ingest.py --movies 50000 --bad-every 500
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+GENRES = ["Action", "Adventure", "Comedy", "Drama", "Family", "Horror", "Romance", "Science Fiction", "Thriller"]
+
+
+def make_movie(movie_id, rng):
+    """Synthetic movie record shaped like 1950_2024_movies_info.json"""
+    return {
+        "id": movie_id,
+        "title": f"Movie {movie_id}",
+        "overview": " ".join(rng.choice(GENRES).lower() for _ in range(60)),
+        "tagline": f"Tagline {movie_id}",
+        "vote_count": rng.randint(0, 20000),
+        "vote_average": round(rng.uniform(0, 10), 1),
+        "revenue": rng.randint(0, 10**9),
+        "budget": rng.randint(0, 10**8),
+        "release_date": f"{rng.randint(1950, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "genres": [{"id": i, "name": name} for i, name in enumerate(rng.sample(GENRES, 2))],
+    }
+
+
+def write_dataset(directory, num_movies, bad_every, seed=0):
+    """Write the same synthetic dataset as a JSON array and as NDJSON"""
+    rng = random.Random(seed)
+    movies = []
+    for movie_id in range(num_movies):
+        movie = make_movie(movie_id, rng)
+        if bad_every and movie_id % bad_every == bad_every - 1:
+            movie["release_date"] = "unknown"
+        movies.append(movie)
+
+    json_path = os.path.join(directory, "movies.json")
+    ndjson_path = os.path.join(directory, "movies.ndjson")
+    with open(json_path, "w") as file:
+        json.dump(movies, file)
+    with open(ndjson_path, "w") as file:
+        for movie in movies:
+            file.write(json.dumps(movie) + "\n")
+    return json_path, ndjson_path
+
+
+class StubCollection:
+    """Accepts objects like a Weaviate collection, without any network calls"""
+
+    name = "BenchmarkStub"
+
+    def __init__(self, latency_per_request=0.0):
+        self.latency_per_request = latency_per_request
+        self.count = 0
+        self.data = SimpleNamespace(insert_many=self._insert_many)
+        self.batch = SimpleNamespace(fixed_size=self._fixed_size)
+
+    def _insert_many(self, objects):
+        time.sleep(self.latency_per_request)
+        self.count += len(objects)
+        return SimpleNamespace(errors={}, has_errors=False)
+
+    @contextmanager
+    def _fixed_size(self, batch_size):
+        pending = []
+
+        def add_object(properties, uuid):
+            pending.append((properties, uuid))
+            if len(pending) >= batch_size:
+                self._insert_many(pending)
+                pending.clear()
+
+        yield SimpleNamespace(add_object=add_object)
+        if pending:
+            self._insert_many(pending)
+
+
+def run_loader(loader, source_path, workdir, latency, conn):
+    """Child process entry point: run one loader and report its numbers"""
+    import add_data
+    from movie_stream import stream_ingest
+
+    collection = StubCollection(latency_per_request=latency)
+    start = time.perf_counter()
+    if loader == "dataframe":
+        add_data.load_dataframe(collection, source_path)
+    else:
+        stream_ingest(
+            collection,
+            source_path,
+            rejects_path=os.path.join(workdir, f"{loader}.rejects.ndjson"),
+            checkpoint_path=os.path.join(workdir, f"{loader}.checkpoint.json"),
+        )
+    elapsed = time.perf_counter() - start
+    conn.send(
+        {
+            "loader": loader,
+            "objects": collection.count,
+            "seconds": round(elapsed, 3),
+            "objects_per_sec": round(collection.count / elapsed, 1),
+            # ru_maxrss is reported in kilobytes on Linux
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movies", type=int, default=20000)
+    parser.add_argument("--bad-every", type=int, default=500, help="Make every Nth record invalid (0 for none).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per batch request.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        json_path, ndjson_path = write_dataset(workdir, args.movies, args.bad_every)
+        runs = [
+            ("dataframe", json_path),
+            ("stream-json", json_path),
+            ("stream-ndjson", ndjson_path),
+        ]
+        for loader, source_path in runs:
+            # The dataframe loader rewrites its source on bad rows, so give it a private copy
+            if loader == "dataframe":
+                private_path = os.path.join(workdir, "dataframe.json")
+                with open(source_path) as src, open(private_path, "w") as dst:
+                    dst.write(src.read())
+                source_path = private_path
+
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=run_loader, args=(loader, source_path, workdir, args.latency, child_conn)
+            )
+            process.start()
+            result = parent_conn.recv()
+            process.join()
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Narrow year-range benchmark: decade partitions vs a single filtered collection.
+
+Draws random year windows of a few years, runs every query against the single
+index with a release_year filter and against the decade router, and writes a
+JSON report with p50/p95 latency per window width and the recall of each
+against an exact (unquantized, single index) ranking.
+
+    # offline, against local in-process indexes
+    python3 helpers/benchmark_partitions.py --backend local
+
+    # against Weaviate: MovieDemo, MovieDemoByDecade (`add_data.py --partition`)
+    # and an unquantized reference (`add_data.py --collection MovieDemoFlat --no-bq`)
+    python3 helpers/benchmark_partitions.py --backend weaviate --reference-collection MovieDemoFlat
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+from benchmark_search import build_queries, percentiles, ranking, recall
+
+from backends import (  # noqa: E402 (benchmark_search puts the app directory on sys.path)
+    COLLECTION_NAME,
+    FIRST_YEAR,
+    LAST_YEAR,
+    PARTITIONED_COLLECTION_NAME,
+    LocalBackend,
+    PartitionedBackend,
+    WeaviateBackend,
+    load_movies,
+)
+from demo_app import SEARCH_LIMIT  # noqa: E402
+
+current_dir = os.path.dirname(__file__)
+
+
+def year_windows(widths, per_width, seed=0):
+    """Random (width, (start, end)) windows inside the dataset's year span"""
+    rng = random.Random(seed)
+    windows = []
+    for width in widths:
+        for _ in range(per_width):
+            start = rng.randint(FIRST_YEAR, LAST_YEAR - width + 1)
+            windows.append((width, (start, start + width - 1)))
+    return windows
+
+
+def build_backends(args):
+    """Return ({"single": backend, "partitioned": backend}, reference, closer)"""
+    if args.backend == "local":
+        movies = load_movies(args.source)
+        backends = {
+            "single": LocalBackend(movies, bq=True),
+            "partitioned": PartitionedBackend.local(movies, bq=True),
+        }
+        return backends, LocalBackend(movies, bq=False), lambda: None
+
+    from add_data import connect
+
+    client = connect()
+    backends = {
+        "single": WeaviateBackend(client, args.collection),
+        "partitioned": PartitionedBackend.weaviate(client, args.partitioned_collection),
+    }
+    reference = WeaviateBackend(client, args.reference_collection) if args.reference_collection else None
+    return backends, reference, client.close
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["local", "weaviate"], default="local")
+    parser.add_argument("--source", default=os.path.join(current_dir, "data/1950_2024_movies_info.json"))
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--partitioned-collection", default=PARTITIONED_COLLECTION_NAME)
+    parser.add_argument("--reference-collection", default=None, help="Unquantized collection used as recall reference.")
+    parser.add_argument("--widths", type=int, nargs="+", default=[1, 3, 5], help="Year window widths to test.")
+    parser.add_argument("--windows", type=int, default=10, help="Random windows per width.")
+    parser.add_argument("--alpha", type=float, default=0.5)
+    parser.add_argument("--limit", type=int, default=SEARCH_LIMIT)
+    parser.add_argument("--generated-queries", type=int, default=10)
+    parser.add_argument("--output", default="partition_benchmark.json")
+    args = parser.parse_args()
+
+    queries = build_queries(args.generated_queries)
+    windows = year_windows(args.widths, args.windows)
+    backends, reference, close = build_backends(args)
+    latencies = {(label, width): [] for label in backends for width in args.widths}
+    recalls = {(label, width): [] for label in backends for width in args.widths}
+    try:
+        for width, year_range in windows:
+            for query in queries:
+                expected = ranking(reference, query, year_range, args.alpha, args.limit) if reference else None
+                for label, backend in backends.items():
+                    start = time.perf_counter()
+                    results = ranking(backend, query, year_range, args.alpha, args.limit)
+                    latencies[label, width].append((time.perf_counter() - start) * 1000)
+                    if expected is not None:
+                        recalls[label, width].append(recall(results, expected))
+    finally:
+        close()
+
+    results = []
+    for (label, width), samples in latencies.items():
+        report = {"index": label, "width_years": width, **percentiles(samples)}
+        if recalls[label, width]:
+            report["recall"] = round(float(np.mean(recalls[label, width])), 4)
+        results.append(report)
+        print(json.dumps(report))
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "backend": args.backend,
+                "num_queries": len(queries),
+                "windows_per_width": args.windows,
+                "alpha": args.alpha,
+                "limit": args.limit,
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Wrote {len(results)} configurations to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Search quality/latency benchmark for the recommender's SEARCH_MODES.
+
+Replays a query set (the app's example prompts plus generated queries) across
+alpha and limit values, with BQ quantization on and off, and writes a JSON
+report with p50/p95/p99 latency, throughput under concurrency and recall
+against the unquantized ranking.
+
+    # offline, against the local in-process index
+    python3 helpers/benchmark_search.py --backend local --output search_report.json
+
+    # against Weaviate: MovieDemo (BQ) and a reference collection loaded with
+    # `python3 helpers/add_data.py --collection MovieDemoFlat --no-bq`
+    python3 helpers/benchmark_search.py --backend weaviate --reference-collection MovieDemoFlat
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+current_dir = os.path.dirname(__file__)
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+from backends import COLLECTION_NAME, LocalBackend, WeaviateBackend, load_movies  # noqa: E402
+from demo_app import EXAMPLE_PROMPTS, SEARCH_LIMIT, SEARCH_MODES  # noqa: E402
+
+GENRES = ["action", "adventure", "animated", "comedy", "crime", "documentary", "drama", "family",
+          "fantasy", "horror", "musical", "mystery", "romantic", "sci-fi", "thriller", "war", "western"]
+QUALIFIERS = ["classic", "feel-good", "dark", "indie", "epic", "quirky", "award-winning", "cult", "slow-burn", "funny"]
+
+
+def build_queries(num_generated, seed=0):
+    """Example prompt movie types followed by generated genre/qualifier combinations"""
+    rng = random.Random(seed)
+    queries = [movie_type for movie_type, _ in EXAMPLE_PROMPTS]
+    while len(queries) < len(EXAMPLE_PROMPTS) + num_generated:
+        queries.append(f"{rng.choice(QUALIFIERS)} {rng.choice(GENRES)} {rng.choice(GENRES)}")
+    return queries
+
+
+def percentiles(latencies_ms):
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+
+
+def ranking(backend, query, year_range, alpha, limit):
+    return [movie["movie_id"] for movie in backend.search(query, year_range, alpha, limit, ["movie_id"])]
+
+
+def recall(results, reference):
+    if not reference:
+        return 1.0
+    return len(set(results) & set(reference)) / len(reference)
+
+
+def run_config(backend, reference, queries, year_range, alpha, limit, concurrency, repeats):
+    """Latency and recall from a sequential pass, throughput from a concurrent one"""
+    latencies, recalls = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results = ranking(backend, query, year_range, alpha, limit)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if reference is not None:
+            recalls.append(recall(results, ranking(reference, query, year_range, alpha, limit)))
+
+    workload = queries * repeats
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda query: ranking(backend, query, year_range, alpha, limit), workload))
+    elapsed = time.perf_counter() - start
+
+    report = percentiles(latencies)
+    report["throughput_qps"] = round(len(workload) / elapsed, 1)
+    if recalls:
+        report["recall"] = round(float(np.mean(recalls)), 4)
+    return report
+
+
+def build_backends(args):
+    """Return ({"bq": backend, "flat": backend}, closer) for the selected backend"""
+    if args.backend == "local":
+        movies = load_movies(args.source)
+        return {"bq": LocalBackend(movies, bq=True), "flat": LocalBackend(movies, bq=False)}, lambda: None
+
+    from add_data import connect
+
+    client = connect()
+    backends = {"bq": WeaviateBackend(client, args.collection)}
+    if args.reference_collection:
+        backends["flat"] = WeaviateBackend(client, args.reference_collection)
+    return backends, client.close
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["local", "weaviate"], default="local")
+    parser.add_argument("--source", default=os.path.join(current_dir, "data/1950_2024_movies_info.json"))
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--reference-collection", default=None, help="Unquantized collection used as recall reference.")
+    parser.add_argument(
+        "--alphas",
+        type=float,
+        nargs="+",
+        default=sorted({0.0, 0.25, 0.5, 0.75, 1.0} | {float(alpha) for _, alpha in SEARCH_MODES.values()}),
+    )
+    parser.add_argument("--limits", type=int, nargs="+", default=[5, SEARCH_LIMIT, 20])
+    parser.add_argument("--year-range", type=int, nargs=2, default=[1990, 2024])
+    parser.add_argument("--generated-queries", type=int, default=44)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3, help="Times the query set is replayed for throughput.")
+    parser.add_argument("--output", default="search_benchmark.json")
+    args = parser.parse_args()
+
+    queries = build_queries(args.generated_queries)
+    backends, close = build_backends(args)
+    reference = backends.get("flat")
+    results = []
+    try:
+        for label, backend in backends.items():
+            for alpha in args.alphas:
+                for limit in args.limits:
+                    report = run_config(
+                        backend,
+                        reference if label == "bq" else None,
+                        queries,
+                        tuple(args.year_range),
+                        alpha,
+                        limit,
+                        args.concurrency,
+                        args.repeats,
+                    )
+                    modes = [mode for mode, (_, mode_alpha) in SEARCH_MODES.items() if mode_alpha == alpha]
+                    report.update({"index": label, "alpha": alpha, "limit": limit, "modes": modes})
+                    results.append(report)
+                    print(json.dumps(report))
+    finally:
+        close()
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "backend": args.backend,
+                "num_queries": len(queries),
+                "year_range": args.year_range,
+                "concurrency": args.concurrency,
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Wrote {len(results)} configurations to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Load test: search sessions/sec on one process, sync pipeline vs async pipeline.
+
+Each simulated session runs what one click on Search does in demo_app.py:
+retrieve, render the results, then consume the full recommendation stream.
+The "sync" pipeline does these one after the other on the session thread, as
+perform_search did before; the "async" pipeline runs retrieval and generation
+on the shared background loop (async_pipeline.SearchRun), so generation
+overlaps with rendering. Sessions run on one thread each, like Streamlit
+script threads.
+
+    # offline: local index with simulated network and generation latency
+    python3 helpers/benchmark_sessions.py --users 8 16 32
+
+    # against Weaviate Cloud and Cohere, using .streamlit/secrets.toml
+    python3 helpers/benchmark_sessions.py --backend weaviate --generator cohere
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmark_search import build_queries, percentiles
+
+from async_pipeline import BackgroundLoop, SearchRun  # noqa: E402 (benchmark_search puts the app directory on sys.path)
+from backends import AsyncWeaviateBackend, LocalBackend, SearchBackend, WeaviateBackend, load_movies  # noqa: E402
+from demo_app import EXAMPLE_PROMPTS, SEARCH_LIMIT, SEARCH_MODES  # noqa: E402
+from generation import (  # noqa: E402
+    astream_cohere,
+    astream_local,
+    build_grouped_prompt,
+    local_recommendation,
+    stream_cohere,
+    stream_local,
+)
+
+current_dir = os.path.dirname(__file__)
+RAG_PROMPT = "Suggest one to two movies out of the following list, for a {}. Give a concise yet fun and positive recommendation."
+
+
+class DelayedBackend(SearchBackend):
+    """Add a fixed network round-trip to another backend's searches"""
+
+    def __init__(self, backend, delay):
+        self.backend = backend
+        self.delay = delay
+        self.name = f"{backend.name} +{delay * 1000:.0f} ms"
+
+    def scored_search(self, query, year_range, alpha, limit, return_properties):
+        time.sleep(self.delay)
+        return self.backend.scored_search(query, year_range, alpha, limit, return_properties)
+
+    async def ascored_search(self, query, year_range, alpha, limit, return_properties):
+        await asyncio.sleep(self.delay)
+        return await self.backend.ascored_search(query, year_range, alpha, limit, return_properties)
+
+    def scored_candidates(self, query, year_range, alpha, k, return_properties):
+        time.sleep(self.delay)
+        return self.backend.scored_candidates(query, year_range, alpha, k, return_properties)
+
+    async def ascored_candidates(self, query, year_range, alpha, k, return_properties):
+        await asyncio.sleep(self.delay)
+        return await self.backend.ascored_candidates(query, year_range, alpha, k, return_properties)
+
+
+def delayed_tokens(text, delay):
+    """Sync counterpart of astream_local(text, delay)"""
+    for token in stream_local(text):
+        time.sleep(delay)
+        yield token
+
+
+def build_pipelines(args, loop):
+    """Return (sync (backend, generate), async (backend, generate), closer)"""
+    closers = []
+    if args.backend == "local":
+        local = LocalBackend(load_movies(args.source))
+        sync_backend = DelayedBackend(local, args.search_ms / 1000)
+        async_backend = sync_backend
+    else:
+        import toml
+        from add_data import connect, toml_file_path
+
+        config = toml.load(toml_file_path)
+        client = connect()
+        closers.append(client.close)
+        sync_backend = WeaviateBackend(client)
+        async_backend = AsyncWeaviateBackend.connect(
+            loop,
+            config["WEAVIATE_URL"],
+            config["WEAVIATE_API_KEY"],
+            headers={"X-Cohere-Api-Key": config["COHERE_API_KEY"]},
+            pool_size=args.pool_size,
+        )
+        closers.append(async_backend.close)
+
+    if args.generator == "local":
+        delay = args.token_ms / 1000
+        sync_generate = lambda task, movies: delayed_tokens(local_recommendation(task, movies), delay)  # noqa: E731
+        async_generate = lambda task, movies: astream_local(local_recommendation(task, movies), delay)  # noqa: E731
+    else:
+        import cohere
+        import toml
+        from add_data import toml_file_path
+
+        api_key = toml.load(toml_file_path)["COHERE_API_KEY"]
+        sync_client = cohere.ClientV2(api_key=api_key)
+        async_client = cohere.AsyncClientV2(api_key=api_key)
+        sync_generate = lambda task, movies: stream_cohere(sync_client, build_grouped_prompt(task, movies))  # noqa: E731
+        async_generate = lambda task, movies: astream_cohere(async_client, build_grouped_prompt(task, movies))  # noqa: E731
+
+    def close():
+        for closer in closers:
+            closer()
+
+    return (sync_backend, sync_generate), (async_backend, async_generate), close
+
+
+def sync_session(pipeline, query, occasion, args):
+    backend, generate = pipeline
+    movies = backend.search(query, tuple(args.year_range), args.alpha, SEARCH_LIMIT, ["title", "tagline"])
+    time.sleep(args.render_ms / 1000)
+    return "".join(generate(RAG_PROMPT.format(occasion), movies))
+
+
+def async_session(pipeline, loop, query, occasion, args):
+    backend, generate = pipeline
+    run = SearchRun(
+        loop,
+        backend.asearch(query, tuple(args.year_range), args.alpha, SEARCH_LIMIT, ["title", "tagline"]),
+        lambda movies: generate(RAG_PROMPT.format(occasion), movies),
+    )
+    run.movies()
+    time.sleep(args.render_ms / 1000)
+    return "".join(run.tokens())
+
+
+def measure(session, workload, users):
+    """Run the workload with `users` concurrent sessions; return sessions/sec and latency percentiles"""
+    latencies = []
+
+    def timed(item):
+        start = time.perf_counter()
+        session(*item)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(timed, workload))
+    elapsed = time.perf_counter() - start
+    return {"sessions_per_sec": round(len(workload) / elapsed, 2), **percentiles(np.array(latencies))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["local", "weaviate"], default="local")
+    parser.add_argument("--generator", choices=["local", "cohere"], default="local")
+    parser.add_argument("--source", default=os.path.join(current_dir, "data/1950_2024_movies_info.json"))
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 8, 32], help="Concurrent sessions to test.")
+    parser.add_argument("--sessions", type=int, default=64, help="Sessions run per configuration.")
+    parser.add_argument("--search-ms", type=float, default=80, help="Simulated search round-trip (local backend).")
+    parser.add_argument("--token-ms", type=float, default=20, help="Simulated time per generated word (local generator).")
+    parser.add_argument("--render-ms", type=float, default=150, help="Simulated time to render the results grid.")
+    parser.add_argument("--pool-size", type=int, default=20, help="Connections of the async Weaviate client.")
+    parser.add_argument("--alpha", type=float, default=SEARCH_MODES["Hybrid"][1])
+    parser.add_argument("--year-range", type=int, nargs=2, default=[1990, 2024])
+    parser.add_argument("--output", default="session_benchmark.json")
+    args = parser.parse_args()
+
+    queries = build_queries(0)
+    workload = [(queries[i % len(queries)], EXAMPLE_PROMPTS[i % len(EXAMPLE_PROMPTS)][1]) for i in range(args.sessions)]
+    loop = BackgroundLoop()
+    sync_pipeline, async_pipeline, close = build_pipelines(args, loop)
+    results = []
+    try:
+        for users in args.users:
+            for label, session in [
+                ("sync", lambda query, occasion: sync_session(sync_pipeline, query, occasion, args)),
+                ("async", lambda query, occasion: async_session(async_pipeline, loop, query, occasion, args)),
+            ]:
+                report = {"pipeline": label, "users": users, **measure(session, workload, users)}
+                results.append(report)
+                print(json.dumps(report))
+    finally:
+        close()
+        loop.close()
+
+    with open(args.output, "w") as file:
+        json.dump({"backend": args.backend, "generator": args.generator, "sessions": args.sessions,
+                   "results": results}, file, indent=2)
+    print(f"Wrote {len(results)} configurations to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
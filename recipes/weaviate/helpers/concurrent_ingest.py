@@ -0,0 +1,184 @@
+import heapq
+import itertools
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from movie_stream import RejectsWriter, build_properties, to_data_objects
+
+
+class AdaptiveBatchSizer:
+    """Adapt batch size and in-flight requests of one shard to observed latency and errors.
+
+    Additive increase while requests are fast and clean, multiplicative decrease
+    as soon as latency exceeds the target or the error rate climbs, similar to the
+    client's dynamic batching but driven by this shard's own measurements.
+    """
+
+    def __init__(
+        self,
+        batch_size=100,
+        concurrency=2,
+        min_batch_size=10,
+        max_batch_size=1000,
+        max_concurrency=8,
+        target_latency=2.0,
+        max_error_rate=0.02,
+    ):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+
+    def record(self, latency, num_objects, num_errors):
+        """Update the batch size and concurrency after a request completes"""
+        error_rate = num_errors / max(num_objects, 1)
+        if error_rate > self.max_error_rate:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            self.concurrency = max(1, self.concurrency - 1)
+        elif latency > self.target_latency:
+            self.batch_size = max(self.min_batch_size, int(self.batch_size * 0.75))
+            self.concurrency = max(1, self.concurrency - 1)
+        else:
+            self.batch_size = min(self.max_batch_size, self.batch_size + self.min_batch_size)
+            if latency < self.target_latency / 2:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+
+@dataclass
+class ShardReport:
+    shard: int
+    inserted: int = 0
+    failed: int = 0
+    retried: int = 0
+    requests: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+    final_batch_size: int = 0
+    final_concurrency: int = 0
+    errors: list = field(default_factory=list)
+
+    @property
+    def objects_per_sec(self):
+        return self.inserted / self.seconds if self.seconds else 0.0
+
+
+def _send(collection, objects):
+    start = time.perf_counter()
+    response = collection.data.insert_many(objects)
+    return time.perf_counter() - start, response
+
+
+def ingest_shard(
+    collection, shard, records, sizer=None, max_retries=3, retry_backoff=1.0, rejects=None, offset=0
+):
+    """Insert one shard of raw movie records with adaptive batching.
+
+    Objects listed in a response's errors are re-queued on their own, so a
+    partially failed batch never re-sends the objects that were stored. Each
+    retry waits `retry_backoff` times its attempt number before it is sent
+    again, while the other batches keep going. Invalid records and objects
+    that still fail after `max_retries` are written to the optional `rejects`
+    writer, at `offset` plus their position in records.
+    """
+    sizer = sizer or AdaptiveBatchSizer()
+    report = ShardReport(shard=shard)
+    start = time.perf_counter()
+
+    def reject(i, error):
+        report.errors.append(error)
+        if rejects is not None:
+            rejects.write(offset + i, error, records[i])
+
+    valid, rejected = build_properties(records)
+    report.rejected = len(rejected)
+    for i, error in rejected:
+        reject(i, error)
+    # (object, attempts, position in records)
+    queue = [(obj, 0, i) for obj, (i, _) in zip(to_data_objects(valid), valid)]
+    # retries waiting for their backoff: (ready at, tie-breaker, queue entry)
+    delayed = []
+    sequence = itertools.count()
+
+    with ThreadPoolExecutor(max_workers=sizer.max_concurrency) as executor:
+        in_flight = {}
+        while queue or delayed or in_flight:
+            now = time.monotonic()
+            while delayed and delayed[0][0] <= now:
+                queue.append(heapq.heappop(delayed)[2])
+            while queue and len(in_flight) < sizer.concurrency:
+                batch, queue = queue[: sizer.batch_size], queue[sizer.batch_size :]
+                future = executor.submit(_send, collection, [obj for obj, _, _ in batch])
+                in_flight[future] = batch
+                report.requests += 1
+
+            timeout = max(0.0, delayed[0][0] - now) if delayed else None
+            if not in_flight:
+                # only retries are left, and none is due yet
+                time.sleep(timeout)
+                continue
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                try:
+                    latency, response = future.result()
+                    errors = response.errors
+                except Exception as e:
+                    # The whole request failed, e.g. a timeout: every object is retried
+                    latency = sizer.target_latency * 2
+                    errors = {i: e for i in range(len(batch))}
+
+                sizer.record(latency, len(batch), len(errors))
+                report.inserted += len(batch) - len(errors)
+                for j, error in errors.items():
+                    obj, attempts, i = batch[j]
+                    if attempts < max_retries:
+                        ready_at = time.monotonic() + retry_backoff * (attempts + 1)
+                        heapq.heappush(delayed, (ready_at, next(sequence), (obj, attempts + 1, i)))
+                        report.retried += 1
+                    else:
+                        report.failed += 1
+                        reject(i, getattr(error, "message", str(error)))
+
+    report.seconds = time.perf_counter() - start
+    report.final_batch_size = sizer.batch_size
+    report.final_concurrency = sizer.concurrency
+    return report
+
+
+def shard_records(records, num_shards):
+    """Split records into num_shards contiguous (offset, shard) pairs of near-equal size"""
+    size, extra = divmod(len(records), num_shards)
+    shards, start = [], 0
+    for i in range(num_shards):
+        end = start + size + (1 if i < extra else 0)
+        shards.append((start, records[start:end]))
+        start = end
+    return [(offset, shard) for offset, shard in shards if shard]
+
+
+def concurrent_ingest(
+    collection, movies_df, num_workers=4, sizer_factory=AdaptiveBatchSizer, rejects_path=None, **kwargs
+):
+    """Shard the movie dataframe across a pool of workers, each with its own adaptive batcher.
+
+    Rejected records of all shards are written to rejects_path, if given.
+    """
+    records = movies_df.to_dict("records")
+    shards = shard_records(records, num_workers)
+    rejects = RejectsWriter(rejects_path) if rejects_path else None
+    try:
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [
+                executor.submit(
+                    ingest_shard, collection, i, shard, sizer_factory(), rejects=rejects, offset=offset, **kwargs
+                )
+                for i, (offset, shard) in enumerate(shards)
+            ]
+            return [future.result() for future in futures]
+    finally:
+        if rejects is not None:
+            rejects.close()
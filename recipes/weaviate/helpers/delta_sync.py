@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import time
+
+from weaviate.classes.query import Filter
+
+from movie_stream import build_properties, iter_chunks, iter_movie_records, to_data_objects
+
+# Properties that text2vec_cohere embeds; only changes to these require re-vectorizing
+VECTORIZED_PROPERTIES = ["title", "overview", "tagline", "genres"]
+
+
+def content_hash(props):
+    """Stable hash of the vectorized properties of a movie"""
+    payload = json.dumps({k: props.get(k) for k in VECTORIZED_PROPERTIES}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_manifest(manifest_path, collection_name):
+    """Return the {uuid: content hash} manifest of the collection's previous sync, or None"""
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    if manifest.get("collection") != collection_name:
+        return None
+    return manifest["hashes"]
+
+
+def save_manifest(manifest_path, collection_name, hashes):
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump({"collection": collection_name, "hashes": hashes}, file)
+    os.replace(tmp_path, manifest_path)
+
+
+def discard_manifest(manifest_path):
+    """Forget the previous sync, e.g. because the collection was recreated"""
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def collection_uuids(collection):
+    return [str(obj.uuid) for obj in collection.iterator(return_properties=["movie_id"])]
+
+
+def delta_sync(collection, json_file_path, manifest_path, chunk_size=100, progress=None):
+    """Bring the collection in line with json_file_path, re-vectorizing only what changed.
+
+    Movies are keyed by generate_uuid5(movie_id). New and changed movies are
+    upserted in batches, movies that disappeared from the file are deleted, and
+    everything else is left untouched. Changes limited to non-vectorized
+    properties (e.g. vote_count) are not detected.
+
+    The manifest is trusted only if it belongs to this collection and lists as
+    many objects as the collection holds. Otherwise it is rebuilt from the
+    collection's UUIDs, so every movie is upserted again. The manifest is saved
+    after every chunk, and only movies whose delete succeeded leave it, so an
+    interrupted or partly failed sync is picked up by the next one.
+
+    Returns a report with the skipped/inserted/updated/removed counts and an
+    estimate of the time saved against a full reload.
+    """
+    name = collection.name
+    report = {"skipped": 0, "inserted": 0, "updated": 0, "removed": 0, "rejected": 0, "failed": 0}
+    manifest = load_manifest(manifest_path, name)
+    count = collection.aggregate.over_all(total_count=True).total_count
+    if manifest is None or len(manifest) != count:
+        # No hash matches None, so every movie in the collection is upserted again
+        manifest = {uuid: None for uuid in collection_uuids(collection)}
+        report["manifest_rebuilt"] = True
+    seen = set()
+    upsert_seconds = 0.0
+    start = time.perf_counter()
+
+    for _, chunk in iter_chunks(iter_movie_records(json_file_path), chunk_size):
+        valid, rejected = build_properties(chunk)
+        report["rejected"] += len(rejected)
+
+        changed = []
+        for item in valid:
+            obj = to_data_objects([item])[0]
+            uuid = str(obj.uuid)
+            seen.add(uuid)
+            digest = content_hash(obj.properties)
+            if manifest.get(uuid) == digest:
+                report["skipped"] += 1
+            else:
+                changed.append((obj, uuid, digest))
+
+        if changed:
+            request_start = time.perf_counter()
+            response = collection.data.insert_many([obj for obj, _, _ in changed])
+            upsert_seconds += time.perf_counter() - request_start
+            for i, (_, uuid, digest) in enumerate(changed):
+                if i in response.errors:
+                    report["failed"] += 1
+                    continue
+                report["updated" if uuid in manifest else "inserted"] += 1
+                manifest[uuid] = digest
+            save_manifest(manifest_path, name, manifest)
+
+        if progress is not None:
+            progress.update(len(chunk))
+
+    removed = [uuid for uuid in manifest if uuid not in seen]
+    for i in range(0, len(removed), chunk_size):
+        ids = removed[i : i + chunk_size]
+        try:
+            response = collection.data.delete_many(where=Filter.by_id().contains_any(ids), verbose=True)
+        except Exception as e:
+            print(f"Error deleting {len(ids)} movies: {e!r}")
+            report["failed"] += len(ids)
+            continue
+        # Movies already gone from the collection don't match and count as deleted
+        failed = {str(obj.uuid) for obj in response.objects if not obj.successful}
+        for uuid in ids:
+            if uuid not in failed:
+                del manifest[uuid]
+                report["removed"] += 1
+            else:
+                report["failed"] += 1
+        save_manifest(manifest_path, name, manifest)
+
+    save_manifest(manifest_path, name, manifest)
+
+    # Estimate a full reload as re-sending every current movie at the observed upsert rate
+    elapsed = time.perf_counter() - start
+    upserted = report["inserted"] + report["updated"]
+    report["seconds"] = round(elapsed, 2)
+    if upserted:
+        full_reload = upsert_seconds / upserted * len(seen)
+        report["estimated_full_reload_seconds"] = round(full_reload, 2)
+        report["estimated_seconds_saved"] = round(max(full_reload - elapsed, 0.0), 2)
+    return report
@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from itertools import islice
+
+from weaviate.classes.data import DataObject
+from weaviate.util import generate_uuid5
+
+# ijson is optional: it is only needed to stream the original JSON array file.
+# NDJSON files (one movie per line) are streamed with the standard library.
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Properties copied as-is from the raw movie record
+SCALAR_PROPERTIES = [
+    "title",
+    "overview",
+    "tagline",
+    "vote_count",
+    "vote_average",
+    "revenue",
+    "budget",
+]
+
+
+def iter_movie_records(json_file_path):
+    """Yield raw movie records one at a time without loading the whole file"""
+    if json_file_path.endswith((".ndjson", ".jsonl")):
+        with open(json_file_path) as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    if ijson is None:
+        raise ImportError(
+            "Streaming a JSON array requires ijson: `pip install ijson`, "
+            "or convert the file to NDJSON (one movie per line)."
+        )
+    with open(json_file_path, "rb") as file:
+        yield from ijson.items(file, "item", use_float=True)
+
+
+def iter_chunks(records, chunk_size, start_offset=0):
+    """Group records into (offset, chunk) pairs, skipping the first start_offset records"""
+    records = iter(records)
+    offset = start_offset
+    for _ in islice(records, start_offset):
+        pass
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield offset, chunk
+        offset += len(chunk)
+
+
+def _release_year(release_date):
+    return datetime.strptime(release_date, "%Y-%m-%d").replace(tzinfo=timezone.utc).year
+
+
+# (property name, function extracting it from a raw movie record), in property order
+PROPERTY_EXTRACTORS = [
+    *((key, lambda record, key=key: record[key]) for key in SCALAR_PROPERTIES),
+    ("movie_id", lambda record: record["id"]),
+    ("release_year", lambda record: _release_year(record["release_date"])),
+    ("genres", lambda record: [genre["name"] for genre in record["genres"]]),
+]
+
+
+def build_properties(records):
+    """Build MovieDemo property dicts for a chunk of raw movie records.
+
+    Properties are extracted record by record; a record that fails any
+    property is rejected instead of aborting the chunk.
+
+    Returns a list of (index, properties) for valid records and a list of
+    (index, error) for rejected ones, where index is the position in records.
+    """
+    valid, rejected = [], []
+    for i, record in enumerate(records):
+        props = {}
+        for name, extract in PROPERTY_EXTRACTORS:
+            try:
+                props[name] = extract(record)
+            except Exception as e:
+                rejected.append((i, f"{name}: {e!r}"))
+                break
+        else:
+            valid.append((i, props))
+    return valid, rejected
+
+
+def decade_of(year):
+    return year - year % 10
+
+
+def decade_tenant(decade):
+    """Tenant name of a decade partition, e.g. 1990s"""
+    return f"{decade}s"
+
+
+def to_data_objects(valid):
+    """Wrap property dicts in DataObjects with the deterministic movie UUID"""
+    return [
+        DataObject(properties=props, uuid=generate_uuid5(props["movie_id"]))
+        for _, props in valid
+    ]
+
+
+class RejectsWriter:
+    """Write rejected records to an NDJSON file, one {"offset", "error", "record"} per line.
+
+    Thread-safe, so concurrent shards can share one rejects file. Appends to
+    an existing file when `append` is set, else starts a new one.
+    """
+
+    def __init__(self, rejects_path, append=False):
+        self._file = open(rejects_path, "a" if append else "w")
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def write(self, offset, error, record):
+        line = json.dumps({"offset": offset, "error": error, "record": record}, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self.count += 1
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_checkpoint(checkpoint_path, json_file_path, collection_name):
+    """Return the number of records of this source file already committed to this collection"""
+    if not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path) as file:
+        checkpoint = json.load(file)
+    if (
+        checkpoint.get("source") != os.path.abspath(json_file_path)
+        or checkpoint.get("collection") != collection_name
+    ):
+        return 0
+    return checkpoint["offset"]
+
+
+def save_checkpoint(checkpoint_path, json_file_path, collection_name, offset, last_uuid):
+    """Atomically record the offset of the last committed record"""
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(
+            {
+                "source": os.path.abspath(json_file_path),
+                "collection": collection_name,
+                "offset": offset,
+                "last_uuid": str(last_uuid) if last_uuid else None,
+            },
+            file,
+        )
+    os.replace(tmp_path, checkpoint_path)
+
+
+def discard_checkpoint(checkpoint_path):
+    """Forget the previous load, e.g. because the collection was recreated"""
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+def stream_ingest(
+    collection,
+    json_file_path,
+    rejects_path,
+    checkpoint_path,
+    chunk_size=100,
+    resume=False,
+    progress=None,
+    poster_encoder=None,
+):
+    """Stream movies from json_file_path into collection, one committed chunk at a time.
+
+    Every chunk is sent with `collection.data.insert_many`, which returns once the
+    objects are stored, so the checkpoint always points at committed data. The
+    checkpoint is only resumed for the same source file and collection name.
+    Rejected records are appended to rejects_path; the source file is never rewritten.
+    If a poster_encoder is given, each movie gets its encoded poster thumbnail.
+
+    Returns a dict with the number of inserted and rejected records.
+    """
+    if resume:
+        start_offset = load_checkpoint(checkpoint_path, json_file_path, collection.name)
+    else:
+        # a run failing before its first commit must not leave the old offset behind
+        discard_checkpoint(checkpoint_path)
+        start_offset = 0
+    stats = {"inserted": 0, "rejected": 0, "start_offset": start_offset}
+
+    with RejectsWriter(rejects_path, append=resume) as rejects:
+        records = iter_movie_records(json_file_path)
+        for offset, chunk in iter_chunks(records, chunk_size, start_offset):
+            valid, rejected = build_properties(chunk)
+            for i, error in rejected:
+                rejects.write(offset + i, error, chunk[i])
+
+            if poster_encoder is not None:
+                posters = poster_encoder.encode([props["movie_id"] for _, props in valid])
+                for _, props in valid:
+                    if props["movie_id"] in posters:
+                        props["poster"] = posters[props["movie_id"]]
+
+            objects = to_data_objects(valid)
+            if objects:
+                response = collection.data.insert_many(objects)
+                for j, error in response.errors.items():
+                    i = valid[j][0]
+                    rejects.write(offset + i, error.message, chunk[i])
+                stats["inserted"] += len(objects) - len(response.errors)
+
+            rejects.flush()
+            save_checkpoint(
+                checkpoint_path,
+                json_file_path,
+                collection.name,
+                offset + len(chunk),
+                objects[-1].uuid if objects else None,
+            )
+            if progress is not None:
+                progress.update(len(chunk))
+    stats["rejected"] = rejects.count
+
+    return stats
@@ -0,0 +1,82 @@
+import base64
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+# Posters are shown at width=200 in the app, so anything larger is wasted bytes
+THUMBNAIL_SIZE = (200, 300)
+THUMBNAIL_QUALITY = 70
+
+
+def encode_thumbnail(img_path, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """Downscale a poster and return it as a base64 encoded JPEG"""
+    with Image.open(img_path) as image:
+        image = image.convert("RGB")
+        image.thumbnail(size)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def _cache_path(cache_dir, img_path, size):
+    # A changed poster gets a new mtime/size and therefore a new cache entry
+    stat = os.stat(img_path)
+    stem = os.path.splitext(os.path.basename(img_path))[0]
+    return os.path.join(cache_dir, f"{stem}-{stat.st_mtime_ns}-{stat.st_size}-{size[0]}x{size[1]}.b64")
+
+
+def _encode_and_cache(img_path, cache_path, size):
+    poster_b64 = encode_thumbnail(img_path, size)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(poster_b64)
+    os.replace(tmp_path, cache_path)
+    return poster_b64
+
+
+class PosterEncoder:
+    """Encode `{id}_poster.jpg` thumbnails in a process pool, backed by an on-disk cache"""
+
+    def __init__(self, img_dir, cache_dir, workers=None, size=THUMBNAIL_SIZE):
+        self.img_dir = img_dir
+        self.cache_dir = cache_dir
+        self.size = size
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._executor = None
+
+    def __enter__(self):
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._executor.shutdown()
+        self._executor = None
+
+    def encode(self, movie_ids):
+        """Return {movie_id: base64 thumbnail}; movies without a poster file are left out"""
+        posters = {}
+        pending = {}
+        for movie_id in movie_ids:
+            img_path = os.path.join(self.img_dir, f"{movie_id}_poster.jpg")
+            if not os.path.exists(img_path):
+                continue
+            cache_path = _cache_path(self.cache_dir, img_path, self.size)
+            if os.path.exists(cache_path):
+                with open(cache_path) as file:
+                    posters[movie_id] = file.read()
+                self.hits += 1
+            else:
+                pending[movie_id] = self._executor.submit(_encode_and_cache, img_path, cache_path, self.size)
+
+        for movie_id, future in pending.items():
+            try:
+                posters[movie_id] = future.result()
+                self.misses += 1
+            except OSError as e:
+                print(f"Error: poster for {movie_id}: {e}")
+        return posters
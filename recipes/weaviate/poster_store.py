@@ -0,0 +1,43 @@
+import base64
+import threading
+from collections import OrderedDict
+
+
+class PosterLRU:
+    """Memory-bounded LRU of decoded poster thumbnails, keyed by movie_id.
+
+    Shared across sessions so chat messages only need to keep movie ids; the
+    image bytes are decoded once and evicted least-recently-used first once
+    max_bytes is exceeded.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, movie_id, poster_b64):
+        """Decode and store a base64 poster, returning its bytes"""
+        with self._lock:
+            if movie_id in self._items:
+                self._items.move_to_end(movie_id)
+                return self._items[movie_id]
+
+        poster = base64.b64decode(poster_b64)
+        with self._lock:
+            if movie_id not in self._items:
+                self._items[movie_id] = poster
+                self.size += len(poster)
+                while self.size > self.max_bytes and len(self._items) > 1:
+                    _, evicted = self._items.popitem(last=False)
+                    self.size -= len(evicted)
+        return poster
+
+    def get(self, movie_id):
+        """Return the poster bytes, or None if it was never stored or got evicted"""
+        with self._lock:
+            poster = self._items.get(movie_id)
+            if poster is not None:
+                self._items.move_to_end(movie_id)
+            return poster
@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire ttl seconds after being stored"""
+
+    def __init__(self, maxsize=256, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or MISSING if absent or expired"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def normalize_query(query):
+    """Case and whitespace insensitive form of a search query"""
+    return " ".join(query.lower().split())
+
+
+def search_key(query, year_range, alpha, limit):
+    """Cache key of a retrieval: the inputs that change what Weaviate returns"""
+    return (normalize_query(query), int(year_range[0]), int(year_range[1]), float(alpha), int(limit))
+
+
+def generation_key(query, year_range, alpha, limit, rag_prompt):
+    """Cache key of a generated recommendation over the same retrieval"""
+    return search_key(query, year_range, alpha, limit) + (rag_prompt,)